@@ -20,6 +20,8 @@ FILES=(
     "mbtiles_manager.py"
     "mbtiles_to_png.py"
     "epaper_display.py"
+    "gy511_sensor.py"
+    "i2c_bus.py"
     "database_manager.py"
     "menu_system.py"
     "navigation_config.json"
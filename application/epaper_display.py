@@ -10,7 +10,7 @@ import time
 import logging
 import spidev
 import RPi.GPIO as GPIO
-from PIL import Image
+from PIL import Image, ImageChops
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +28,14 @@ class EPaperDisplay:
         self.width = 800
         self.height = 480
         
+        # Dirty tracking: last frame pushed to the panel (1-bit, black pixels set)
+        self._frame = None
+        self._partial_count = 0
+        # Partial refreshes ghost over time; force a full refresh after this many
+        self.max_partial_refreshes = 10
+        # Use a partial refresh only when the changed area is below this fraction
+        self.partial_area_ratio = 0.5
+        
         # SPI setup
         self.spi = spidev.SpiDev()
         
@@ -81,6 +89,10 @@ class EPaperDisplay:
             self._send_command(0x60)  # TCON_SETTING
             self._send_data(0x22)
             
+            # Panel content is unknown after a reset
+            self._frame = None
+            self._partial_count = 0
+            
             logger.info("E-Paper display initialized successfully")
             return True
             
@@ -116,48 +128,93 @@ class EPaperDisplay:
         while GPIO.input(self.BUSY_PIN) == 1:
             time.sleep(0.01)
     
-    def update(self, image):
-        """Update display with new image"""
+    def _prepare_frame(self, image):
+        """Convert image to a 1-bit frame where black pixels are set bits"""
+        if image.size != (self.width, self.height):
+            image = image.resize((self.width, self.height))
+        
+        if image.mode != 'L':
+            image = image.convert('L')
+        
+        return image.point(lambda x: 255 if x < 128 else 0, '1')
+    
+    def _send_buffer(self, buf):
+        """Send packed pixel data in chunks"""
+        chunk_size = 4096
+        for i in range(0, len(buf), chunk_size):
+            GPIO.output(self.DC_PIN, GPIO.HIGH)
+            GPIO.output(self.CS_PIN, GPIO.LOW)
+            self.spi.writebytes2(buf[i:i + chunk_size])
+            GPIO.output(self.CS_PIN, GPIO.HIGH)
+    
+    def _refresh_full(self, frame):
+        """Push the whole frame and run a full refresh"""
+        if self._partial_count:
+            self._send_command(0x50)  # VCOM_AND_DATA_INTERVAL_SETTING (full mode)
+            self._send_data(0x11)
+            self._send_data(0x07)
+        
+        self._send_command(0x13)  # DATA_START_TRANSMISSION_2
+        self._send_buffer(frame.tobytes())
+        
+        self._send_command(0x12)  # DISPLAY_REFRESH
+        self._wait_until_idle()
+        self._partial_count = 0
+    
+    def _refresh_partial(self, frame, bbox):
+        """Push only the bbox region of the frame and run a partial refresh"""
+        # Window X coordinates must be byte aligned
+        x_start = bbox[0] // 8 * 8
+        x_end = min(self.width, (bbox[2] + 7) // 8 * 8)
+        y_start, y_end = bbox[1], bbox[3]
+        
+        self._send_command(0x50)  # VCOM_AND_DATA_INTERVAL_SETTING (partial mode)
+        self._send_data(0xA9)
+        self._send_data(0x07)
+        
+        self._send_command(0x91)  # PARTIAL_IN
+        self._send_command(0x90)  # PARTIAL_WINDOW
+        for value in (x_start, x_end - 1, y_start, y_end - 1):
+            self._send_data(value >> 8)
+            self._send_data(value & 0xFF)
+        self._send_data(0x01)
+        
+        self._send_command(0x13)  # DATA_START_TRANSMISSION_2
+        self._send_buffer(frame.crop((x_start, y_start, x_end, y_end)).tobytes())
+        
+        self._send_command(0x12)  # DISPLAY_REFRESH
+        self._wait_until_idle()
+        self._send_command(0x92)  # PARTIAL_OUT
+        self._partial_count += 1
+    
+    def update(self, image, full_refresh=False):
+        """Update display with new image
+        
+        Only the region that changed since the last update is pushed when it is
+        small enough; unchanged frames are skipped entirely.
+        """
         try:
-            # Ensure image is correct size and format
-            if image.size != (self.width, self.height):
-                image = image.resize((self.width, self.height))
-            
-            if image.mode != 'L':
-                image = image.convert('L')
-            
-            # Convert to 1-bit
-            image = image.point(lambda x: 0 if x < 128 else 255, '1')
+            frame = self._prepare_frame(image)
             
-            # Send image data
-            self._send_command(0x13)  # DATA_START_TRANSMISSION_2
+            if full_refresh or self._frame is None:
+                bbox = (0, 0, self.width, self.height)
+            else:
+                bbox = ImageChops.logical_xor(frame, self._frame).getbbox()
+                if bbox is None:
+                    logger.debug("Display content unchanged - skipping refresh")
+                    return
             
-            # Convert image to bytes
-            buf = []
-            for y in range(self.height):
-                for x in range(0, self.width, 8):
-                    byte = 0
-                    for bit in range(8):
-                        if x + bit < self.width:
-                            pixel = image.getpixel((x + bit, y))
-                            if pixel == 0:  # Black pixel
-                                byte |= (1 << (7 - bit))
-                    buf.append(byte)
-            
-            # Send data in chunks
-            chunk_size = 4096
-            for i in range(0, len(buf), chunk_size):
-                chunk = buf[i:i + chunk_size]
-                GPIO.output(self.DC_PIN, GPIO.HIGH)
-                GPIO.output(self.CS_PIN, GPIO.LOW)
-                self.spi.writebytes(chunk)
-                GPIO.output(self.CS_PIN, GPIO.HIGH)
-            
-            # Refresh display
-            self._send_command(0x12)  # DISPLAY_REFRESH
-            self._wait_until_idle()
+            area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+            if (not full_refresh and self._frame is not None and
+                    area < self.width * self.height * self.partial_area_ratio and
+                    self._partial_count < self.max_partial_refreshes):
+                self._refresh_partial(frame, bbox)
+                logger.info(f"Display partially updated: {bbox}")
+            else:
+                self._refresh_full(frame)
+                logger.info("Display updated successfully")
             
-            logger.info("Display updated successfully")
+            self._frame = frame
             
         except Exception as e:
             logger.error(f"Error updating display: {e}")
@@ -167,7 +224,7 @@ class EPaperDisplay:
         try:
             # Create white image
             white_image = Image.new('L', (self.width, self.height), 255)
-            self.update(white_image)
+            self.update(white_image, full_refresh=True)
             logger.info("Display cleared")
         except Exception as e:
             logger.error(f"Error clearing display: {e}")
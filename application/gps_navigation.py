@@ -25,7 +25,7 @@ from gpiozero import Button
 from PIL import Image, ImageDraw, ImageFont
 
 # Custom imports
-from mbtiles_manager import MBTilesManager
+from mbtiles_manager import MBTilesManager, deg2num, deg2num_vec
 from epaper_display import EPaperDisplay
 from database_manager import DatabaseManager
 from menu_system import MenuSystem
@@ -246,6 +246,9 @@ class WiFiManager:
         self.ssid = None
         self.signal_strength = 0
         self.ip_address = None
+        self.running = False
+        self.thread = None
+        self._stop_event = threading.Event()
         
     def check_wifi_status(self):
         """Check current WiFi connection status"""
@@ -278,6 +281,30 @@ class WiFiManager:
             
         return self.is_connected
     
+    def start_monitoring(self, interval=10):
+        """Check WiFi status periodically in a background thread"""
+        self.check_wifi_status()
+        
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._monitor_loop, args=(interval,))
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def _monitor_loop(self, interval):
+        """WiFi status polling loop"""
+        while self.running:
+            if self._stop_event.wait(interval):
+                break
+            self.check_wifi_status()
+    
+    def stop(self):
+        """Stop WiFi status monitoring"""
+        self.running = False
+        self._stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+    
     def get_status(self):
         """Get current WiFi status"""
         return {
@@ -513,6 +540,9 @@ class MapRenderer:
         self.font_medium = self._load_font(16)
         self.font_large = self._load_font(20)
         self.font_title = self._load_font(24)
+        
+        # Rasterized static labels: {(font, text): (mask, left, top)}
+        self._label_cache = {}
     
     def _load_font(self, size):
         """Load font with fallback"""
@@ -524,15 +554,36 @@ class MapRenderer:
             except:
                 return ImageFont.load_default()
     
+    def _get_label_mask(self, font, text):
+        """Get the cached mask and bbox offset of a static label, rasterizing it on first use"""
+        key = (font, text)
+        entry = self._label_cache.get(key)
+        if entry is None:
+            # Laid out as one string so kerning and positioning match draw.text()
+            left, top, right, bottom = font.getbbox(text, mode='1')
+            mask = None
+            if right > left and bottom > top:
+                mask = Image.new('1', (right - left, bottom - top), 0)
+                ImageDraw.Draw(mask).text((-left, -top), text, fill=1, font=font)
+            entry = (mask, left, top)
+            self._label_cache[key] = entry
+        return entry
+    
+    def _draw_label(self, draw, xy, text, font, fill=0):
+        """Draw a static label by blitting its cached mask instead of re-rasterizing
+        it through FreeType; text that changes between frames goes through draw.text()"""
+        mask, left, top = self._get_label_mask(font, text)
+        if mask is not None:
+            draw.bitmap((xy[0] + left, xy[1] + top), mask, fill=fill)
+    
     def render_sync_setup_screen(self):
         """Render sync setup configuration screen"""
-        image = Image.new('L', (self.width, self.height), 255)
+        image = Image.new('1', (self.width, self.height), 1)
         draw = ImageDraw.Draw(image)
         
         # Title
         title = "Device Configuration Required"
-        bbox = draw.textbbox((0, 0), title, font=self.font_title)
-        title_width = bbox[2] - bbox[0]
+        title_width = int(self.font_title.getlength(title))
         title_x = (self.width - title_width) // 2
         draw.text((title_x, 50), title, fill=0, font=self.font_title)
         
@@ -556,16 +607,14 @@ class MapRenderer:
         
         for message in messages:
             if message:  # Skip empty lines for spacing
-                bbox = draw.textbbox((0, 0), message, font=self.font_medium)
-                text_width = bbox[2] - bbox[0]
+                text_width = int(self.font_medium.getlength(message))
                 text_x = (self.width - text_width) // 2
                 draw.text((text_x, y_pos), message, fill=0, font=self.font_medium)
             y_pos += 25
         
         # Bottom instruction
         bottom_text = "Press any button to retry sync key detection"
-        bbox = draw.textbbox((0, 0), bottom_text, font=self.font_small)
-        text_width = bbox[2] - bbox[0]
+        text_width = int(self.font_small.getlength(bottom_text))
         text_x = (self.width - text_width) // 2
         draw.text((text_x, self.height - 40), bottom_text, fill=0, font=self.font_small)
         
@@ -584,16 +633,12 @@ class MapRenderer:
                 # No map available for coordinates
                 return self._render_no_map_available(lat, lon, wifi_status, gps_status)
             
-            # Generate base map using the selected reader
-            image_data, metadata = reader.generate_composite_image(
+            # Generate base map using the selected reader, as an image rather than encoded bytes
+            base_image, metadata = reader.generate_composite_image(
                 lat, lon, zoom, self.width, self.height,
-                use_fallback=True, crop_to_size=True
+                use_fallback=True, crop_to_size=True, output_format=None
             )
             
-            # Convert to PIL Image
-            from io import BytesIO
-            base_image = Image.open(BytesIO(image_data))
-            
             # Convert to grayscale for e-paper
             base_image = base_image.convert('L')
             
@@ -618,7 +663,7 @@ class MapRenderer:
     
     def _render_no_map_available(self, lat, lon, wifi_status, gps_status):
         """Render screen when no map is available for coordinates"""
-        image = Image.new('L', (self.width, self.height), 255)
+        image = Image.new('1', (self.width, self.height), 1)
         draw = ImageDraw.Draw(image)
         
         # Draw status bar
@@ -653,7 +698,7 @@ class MapRenderer:
     
     def _render_map_error(self, error_msg, lat, lon, wifi_status, gps_status):
         """Render screen when map rendering fails"""
-        image = Image.new('L', (self.width, self.height), 255)
+        image = Image.new('1', (self.width, self.height), 1)
         draw = ImageDraw.Draw(image)
         
         # Draw status bar
@@ -681,17 +726,11 @@ class MapRenderer:
         img_array = np.array(image)
         img_array = 255 - img_array  # Invert: white becomes black, black becomes white
         
-        # Apply threshold to make it more black and white
+        # Apply threshold to make it pure black and white
         # Use a lower threshold since we inverted (lighter areas become white)
-        img_array = np.where(img_array > 100, 255, 0)
-        
-        # Increase contrast on the inverted image
-        inverted_image = Image.fromarray(img_array.astype('uint8'))
-        from PIL import ImageEnhance
-        enhancer = ImageEnhance.Contrast(inverted_image)
-        final_image = enhancer.enhance(1.2)  # Reduced contrast enhancement
-        
-        return final_image
+        # The result is a 1-bit image, matching the e-paper and keeping overlay
+        # drawing on an 8x smaller buffer (no contrast pass needed after this)
+        return Image.fromarray(img_array > 100)
     
     def _add_overlays(self, image, lat, lon, zoom, heading, metadata, wifi_status=None, gps_status=None, map_points=None):
         """Add overlays to the map"""
@@ -705,7 +744,7 @@ class MapRenderer:
             self._draw_map_points(draw, map_points, lat, lon, zoom)
         
         # Draw center crosshair
-        self._draw_crosshair(draw)
+        self._draw_crosshair(image, draw)
         
         # Draw graticule
         self._draw_graticule(draw, lat, lon, zoom)
@@ -722,15 +761,18 @@ class MapRenderer:
         if not map_points or len(map_points) < 2:
             return
         
-        # Convert map points to screen coordinates
-        screen_points = []
-        for point in map_points:
-            screen_x, screen_y = self._geo_to_screen(
-                point['latitude'], point['longitude'], 
-                center_lat, center_lon, zoom
-            )
-            if 0 <= screen_x <= self.width and 0 <= screen_y <= self.height:
-                screen_points.append((screen_x, screen_y))
+        # Convert map points to screen coordinates in one vectorized pass
+        if self.mbtiles_manager.current_reader:
+            center_x, center_y = deg2num(center_lat, center_lon, zoom)
+            tiles_x, tiles_y = deg2num_vec([point['latitude'] for point in map_points],
+                                           [point['longitude'] for point in map_points], zoom)
+            points = zip(((tiles_x - center_x) * 256 + self.width // 2).tolist(),
+                         ((tiles_y - center_y) * 256 + self.height // 2).tolist())
+        else:
+            points = [(self.width // 2, self.height // 2)] * len(map_points)
+        
+        screen_points = [(screen_x, screen_y) for screen_x, screen_y in points
+                         if 0 <= screen_x <= self.width and 0 <= screen_y <= self.height]
         
         # Draw route line
         if len(screen_points) > 1:
@@ -741,26 +783,6 @@ class MapRenderer:
         for point in screen_points:
             draw.ellipse([point[0] - 3, point[1] - 3, point[0] + 3, point[1] + 3], fill=0)
     
-    def _geo_to_screen(self, lat, lon, center_lat, center_lon, zoom):
-        """Convert geographic coordinates to screen coordinates"""
-        # Get current reader for coordinate conversion
-        reader = self.mbtiles_manager.current_reader
-        if not reader:
-            return self.width // 2, self.height // 2
-        
-        center_x, center_y = reader.deg2num(center_lat, center_lon, zoom)
-        point_x, point_y = reader.deg2num(lat, lon, zoom)
-        
-        # Calculate offset in tiles
-        tile_offset_x = point_x - center_x
-        tile_offset_y = point_y - center_y
-        
-        # Convert to screen coordinates (256 pixels per tile)
-        screen_x = self.width // 2 + int(tile_offset_x * 256)
-        screen_y = self.height // 2 + int(tile_offset_y * 256)
-        
-        return screen_x, screen_y
-    
     def _draw_status_bar(self, draw, wifi_status, gps_status, lat, lon):
         """Draw status bar at top of screen"""
         # Background for status bar
@@ -785,21 +807,19 @@ class MapRenderer:
             wifi_text += "✗ Disconnected"
         
         # Position WiFi text in center
-        bbox = draw.textbbox((0, 0), wifi_text, font=self.font_small)
-        wifi_width = bbox[2] - bbox[0]
+        wifi_width = int(self.font_small.getlength(wifi_text))
         wifi_x = (self.width - wifi_width) // 2
         draw.text((wifi_x, 5), wifi_text, fill=0, font=self.font_small)
         
         # Time
         current_time = datetime.now().strftime("%H:%M")
-        bbox = draw.textbbox((0, 0), current_time, font=self.font_small)
-        time_width = bbox[2] - bbox[0]
+        time_width = int(self.font_small.getlength(current_time))
         draw.text((self.width - time_width - 10, 5), current_time, fill=0, font=self.font_small)
         
         # Draw separator line
         draw.line([0, 30, self.width, 30], fill=0, width=1)
     
-    def _draw_crosshair(self, draw):
+    def _draw_crosshair(self, image, draw):
         """Draw center crosshair"""
         center_x = self.width // 2
         center_y = self.height // 2
@@ -808,8 +828,8 @@ class MapRenderer:
         draw.line([center_x - 15, center_y, center_x + 15, center_y], fill=0, width=2)
         draw.line([center_x, center_y - 15, center_x, center_y + 15], fill=0, width=2)
         
-        # Draw center dot
-        draw.ellipse([center_x - 2, center_y - 2, center_x + 2, center_y + 2], fill=0)
+        # Draw center dot as a direct 5x5 block fill (no ellipse rasterization)
+        image.paste(0, (center_x - 2, center_y - 2, center_x + 3, center_y + 3))
     
     def _draw_graticule(self, draw, lat, lon, zoom):
         """Draw coordinate grid lines"""
@@ -835,11 +855,12 @@ class MapRenderer:
             text_x = rose_x + int((rose_radius - 15) * math.sin(math.radians(angle)))
             text_y = rose_y - int((rose_radius - 15) * math.cos(math.radians(angle)))
             
-            bbox = draw.textbbox((0, 0), direction, font=self.font_small)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            draw.text((text_x - text_width//2, text_y - text_height//2), 
-                     direction, fill=0, font=self.font_small)
+            # The cached mask spans the same box draw.textbbox() would report
+            mask, _, _ = self._get_label_mask(self.font_small, direction)
+            text_width = mask.width
+            text_height = mask.height
+            self._draw_label(draw, (text_x - text_width//2, text_y - text_height//2), 
+                             direction, self.font_small)
         
         # Heading indicator (if we have valid heading data or forced)
         if heading > 0 or force_show:
@@ -926,7 +947,7 @@ class MapRenderer:
     
     def render_waiting_screen(self, wifi_status=None):
         """Render waiting for GPS signal screen"""
-        image = Image.new('L', (self.width, self.height), 255)
+        image = Image.new('1', (self.width, self.height), 1)
         draw = ImageDraw.Draw(image)
         
         # Draw status bar
@@ -945,8 +966,7 @@ class MapRenderer:
         
         # Title
         title = "Waiting for GPS Signal"
-        bbox = draw.textbbox((0, 0), title, font=self.font_large)
-        title_width = bbox[2] - bbox[0]
+        title_width = int(self.font_large.getlength(title))
         title_x = (self.width - title_width) // 2
         draw.text((title_x, msg_y + 40), title, fill=0, font=self.font_large)
         
@@ -960,8 +980,7 @@ class MapRenderer:
         
         y_pos = msg_y + 80
         for instruction in instructions:
-            bbox = draw.textbbox((0, 0), instruction, font=self.font_small)
-            text_width = bbox[2] - bbox[0]
+            text_width = int(self.font_small.getlength(instruction))
             text_x = (self.width - text_width) // 2
             draw.text((text_x, y_pos), instruction, fill=0, font=self.font_small)
             y_pos += 25
@@ -984,7 +1003,9 @@ class GPSNavigationSystem:
         
         # Initialize MBTiles manager
         assets_folder = self.config.get('assets_folder', '/opt/elcano/assets')
-        self.mbtiles_manager = MBTilesManager(assets_folder)
+        mbtiles_settings = self.config.get('mbtiles_settings', {})
+        self.mbtiles_manager = MBTilesManager(
+            assets_folder, max_open_files=mbtiles_settings.get('max_open_files', 3))
         
         # Initialize sync manager
         self.sync_manager = SyncManager(self.db)
@@ -1033,6 +1054,9 @@ class GPSNavigationSystem:
         self._last_gy511_heading = None
         self._gy511_update_time = 0
         
+        # Key of the waiting screen currently on the display (None if another screen is shown)
+        self._last_waiting_key = None
+        
         logger.info("GPS Navigation System initialized")
     
     def _load_config(self, config_file):
@@ -1044,6 +1068,7 @@ class GPSNavigationSystem:
             'display_update_interval': 5,
             'sync_interval': 300,
             'logbook_interval': 60,
+            'wifi_check_interval': 10,
             'assets_folder': '/opt/elcano/assets'
         }
         
@@ -1066,8 +1091,8 @@ class GPSNavigationSystem:
         # Check sync configuration first
         if not self.sync_manager.is_valid_sync_key():
             logger.warning("Invalid or missing sync key - showing setup screen")
-            self._show_sync_setup_screen()
-            return
+            if not self._show_sync_setup_screen():
+                return
         
         # Initialize display
         if not self.display.initialize():
@@ -1083,6 +1108,9 @@ class GPSNavigationSystem:
         if not self.gy511.begin():
             logger.warning("Failed to start GY-511 sensor - continuing without compass")
         
+        # Poll WiFi status off the main loop (iwconfig/hostname are subprocess calls)
+        self.wifi.start_monitoring(self.config.get('wifi_check_interval', 10))
+        
         # Show initial screen
         self._show_waiting_screen()
         
@@ -1091,22 +1119,19 @@ class GPSNavigationSystem:
         self._main_loop()
     
     def _show_sync_setup_screen(self):
-        """Show sync setup configuration screen and wait for button press"""
+        """Show sync setup screen until a valid sync key is detected
+        
+        Returns True once a valid key is found, False if the display could not
+        be initialized.
+        """
         if not self.display.initialize():
             logger.error("Failed to initialize display for sync setup")
-            return
-        
-        # Render and display sync setup screen
-        setup_image = self.map_renderer.render_sync_setup_screen()
-        self.display.update(setup_image)
+            return False
         
-        # Wait for any button press
-        logger.info("Waiting for button press to retry sync key detection...")
-        button_pressed = False
+        button_pressed = threading.Event()
         
         def on_any_button():
-            nonlocal button_pressed
-            button_pressed = True
+            button_pressed.set()
         
         # Temporarily assign all buttons to the same callback
         self.button_up.when_pressed = on_any_button
@@ -1115,9 +1140,23 @@ class GPSNavigationSystem:
         self.button_right.when_pressed = on_any_button
         self.button_center.when_pressed = on_any_button
         
-        # Wait for button press
-        while not button_pressed:
-            time.sleep(0.1)
+        # Render and display sync setup screen
+        setup_image = self.map_renderer.render_sync_setup_screen()
+        self.display.update(setup_image)
+        
+        while True:
+            # Block until a button callback fires
+            logger.info("Waiting for button press to retry sync key detection...")
+            button_pressed.wait()
+            button_pressed.clear()
+            
+            # Re-check sync key
+            self.sync_manager = SyncManager(self.db)  # Reinitialize to re-read key
+            if self.sync_manager.is_valid_sync_key():
+                logger.info("Valid sync key detected - continuing with normal startup")
+                break
+            
+            logger.info("Still no valid sync key - keeping setup screen")
         
         # Restore original button callbacks
         self.button_up.when_pressed = self.on_button_up
@@ -1126,22 +1165,24 @@ class GPSNavigationSystem:
         self.button_right.when_pressed = self.on_button_right
         self.button_center.when_pressed = self.on_button_center
         
-        # Re-check sync key
-        self.sync_manager = SyncManager(self.db)  # Reinitialize to re-read key
-        
-        if self.sync_manager.is_valid_sync_key():
-            logger.info("Valid sync key detected - continuing with normal startup")
-            # Continue with normal startup
-            self.start()
-        else:
-            logger.info("Still no valid sync key - showing setup screen again")
-            self._show_sync_setup_screen()  # Show again
+        # Menu must use the re-read sync manager as well
+        self.menu.sync = self.sync_manager
+        return True
     
     def _show_waiting_screen(self):
         """Show waiting for GPS screen"""
         wifi_status = self.wifi.get_status()
+        
+        # The waiting screen only changes with the WiFi status and the clock minute,
+        # so skip the render and the e-paper refresh when neither has changed
+        key = (wifi_status.get('connected'), wifi_status.get('ssid'),
+               datetime.now().strftime("%H:%M"))
+        if key == self._last_waiting_key:
+            return
+        
         waiting_image = self.map_renderer.render_waiting_screen(wifi_status)
         self.display.update(waiting_image)
+        self._last_waiting_key = key
     
     def _main_loop(self):
         """Main application loop"""
@@ -1151,9 +1192,8 @@ class GPSNavigationSystem:
             try:
                 current_time = time.time()
                 
-                # Update WiFi status
-                self.wifi.check_wifi_status()
-                
+                # GPS, GY-511 and WiFi are read by their own threads; these calls
+                # only return the latest cached values
                 # Get GPS status
                 gps_status = self.gps.get_status()
                 
@@ -1225,9 +1265,11 @@ class GPSNavigationSystem:
             
             # Display the map
             self.display.update(map_image)
+            self._last_waiting_key = None
             
-            logger.debug(f"Map updated: {lat:.4f}, {lon:.4f}, zoom {self.current_zoom}, "
-                        f"heading {heading:.1f}°")
+            # Lazy formatting: this runs on every map update and debug is usually off
+            logger.debug("Map updated: %.4f, %.4f, zoom %s, heading %.1f°",
+                         lat, lon, self.current_zoom, heading)
             
         except Exception as e:
             logger.error(f"Error updating map display: {e}")
@@ -1237,6 +1279,7 @@ class GPSNavigationSystem:
         try:
             menu_image = self.menu.render()
             self.display.update(menu_image)
+            self._last_waiting_key = None
         except Exception as e:
             logger.error(f"Error in menu mode: {e}")
             self.in_menu = False
@@ -1378,6 +1421,9 @@ class GPSNavigationSystem:
         # Stop GY-511
         self.gy511.cleanup()
         
+        # Stop WiFi monitoring
+        self.wifi.stop()
+        
         # Cleanup display
         self.display.cleanup()
         
@@ -8,13 +8,70 @@ with enhanced calibration and heading calculation.
 
 import time
 import math
+import struct
 import logging
-import smbus
+import numpy as np
+from smbus2 import i2c_msg
 import threading
-from collections import deque
+from fcntl import ioctl
+# smbus2 only exports i2c_msg publicly; the prebuilt transfers below need its
+# ioctl argument struct, so the smbus2 version is pinned in requirements.txt.
+# If its layout changes anyway, reads fall back to the slower bus.i2c_rdwr.
+try:
+    from smbus2.smbus2 import i2c_rdwr_ioctl_data
+except ImportError:
+    i2c_rdwr_ioctl_data = None
+from i2c_bus import get_bus, get_lock, release_bus
 
 logger = logging.getLogger(__name__)
 
+# Combined read/write transfer ioctl from linux/i2c-dev.h
+I2C_RDWR = 0x0707
+
+# Per-sample constants, bound as default arguments in the hot paths below
+_RAD_TO_DEG = 180.0 / math.pi
+_ACCEL_SAMPLE = struct.Struct('<hhh')  # little-endian X, Y, Z
+_MAG_SAMPLE = struct.Struct('>hhh')    # big-endian X, Z, Y
+
+def _unit(y, x, _sqrt=math.sqrt):
+    """Return (sin, cos) of atan2(y, x) without calling trig functions"""
+    r = _sqrt(x * x + y * y)
+    if r == 0:
+        return 0.0, 1.0
+    return y / r, x / r
+
+def _tilt_heading(ax, ay, az, mx, my, mz,
+                  _atan2=math.atan2, _sqrt=math.sqrt, _sin=math.sin, _cos=math.cos,
+                  _deg=_RAD_TO_DEG):
+    """Return (heading, tilt_compensated_heading, (sin, cos) of the latter) for one sample"""
+    # Simple heading calculation (no tilt compensation), normalized to 0-360 degrees
+    heading = (_atan2(my, mx) * _deg) % 360.0
+    
+    accel_norm = _sqrt(ax * ax + ay * ay + az * az)
+    if accel_norm == 0:
+        return heading, heading, _unit(my, mx)
+    
+    # Normalize accelerometer readings
+    inv_norm = 1.0 / accel_norm
+    ax *= inv_norm
+    ay *= inv_norm
+    az *= inv_norm
+    
+    # Calculate roll and pitch
+    roll = _atan2(ay, az)
+    pitch = _atan2(-ax, _sqrt(ay * ay + az * az))
+    
+    # Tilt compensation (de-rotate by roll, then pitch; NXP AN4248)
+    sp = _sin(pitch)
+    cp = _cos(pitch)
+    sr = _sin(roll)
+    cr = _cos(roll)
+    mag_x_comp = mx * cp + (my * sr + mz * cr) * sp
+    mag_y_comp = my * cr - mz * sr
+    
+    return (heading, (_atan2(mag_y_comp, mag_x_comp) * _deg) % 360.0,
+            _unit(mag_y_comp, mag_x_comp))
+
 class GY511:
     """GY-511 (LSM303DLHC) compass and accelerometer sensor driver"""
     
@@ -32,12 +89,24 @@ class GY511:
     MAG_CRB_REG_M = 0x01
     MAG_MR_REG_M = 0x02
     MAG_OUT_X_H_M = 0x03
+    MAG_IRA_REG_M = 0x0A
     
-    def __init__(self, bus_number=1):
+    def __init__(self, bus_number=1, drdy_pin=None):
         self.bus_number = bus_number
         self.bus = None
+        self._bus_lock = None
+        # BCM pin wired to the magnetometer DRDY output; None falls back to polling
+        self.drdy_pin = drdy_pin
+        # In DRDY mode, read anyway when no sample arrived for this many seconds
+        self.drdy_timeout = 0.5
+        self._accel_msgs = None
+        self._mag_msgs = None
+        # Packed I2C_RDWR ioctl arguments pointing at the messages above
+        self._accel_xfer = None
+        self._mag_xfer = None
         self.running = False
         self.thread = None
+        self._stop_event = threading.Event()
         
         # Sensor data
         self.accel_x = 0
@@ -46,6 +115,8 @@ class GY511:
         self.mag_x = 0
         self.mag_y = 0
         self.mag_z = 0
+        # Last uncalibrated magnetometer sample (x, y, z)
+        self._mag_raw = (0, 0, 0)
         
         # Heading calculation
         self.heading = 0.0
@@ -58,44 +129,103 @@ class GY511:
         self.mag_scale_x = 1.0
         self.mag_scale_y = 1.0
         self.mag_scale_z = 1.0
+        self._mag_cal = None
+        self._apply_calibration()
         
-        # Data smoothing
-        self.heading_history = deque(maxlen=5)
+        # Data smoothing: complementary filter on the heading unit vector
+        # (weight kept from the previous estimate on each sample)
+        self.heading_alpha = 0.75
+        self._heading_sin = 0.0
+        self._heading_cos = 0.0
+        self._heading_ready = False
         
-        # Last update time
+        # Last update time (wall clock for callers, monotonic for freshness checks)
         self.last_update = 0
+        self._last_read = 0.0
+        # Reads may come from the polling thread, DRDY callback or update_readings
+        self._read_lock = threading.Lock()
         
         logger.info("GY511 sensor initialized")
     
+    def _probe(self, address, register):
+        """Check that a device ACKs a register read at the given address"""
+        try:
+            self.bus.read_byte_data(address, register)
+            return True
+        except OSError:
+            return False
+    
     def begin(self):
         """Initialize the GY-511 sensor"""
         try:
-            self.bus = smbus.SMBus(self.bus_number)
-            
-            # Initialize accelerometer
-            # Enable accelerometer, 50Hz, all axes
-            self.bus.write_byte_data(self.ACCEL_ADDRESS, self.ACCEL_CTRL_REG1_A, 0x47)
+            # The bus handle is shared with any other driver on the same bus
+            self.bus = get_bus(self.bus_number)
+            self._bus_lock = get_lock(self.bus_number)
             
-            # Set accelerometer scale to ±2g
-            self.bus.write_byte_data(self.ACCEL_ADDRESS, self.ACCEL_CTRL_REG4_A, 0x00)
+            # Probe both devices directly on the bus instead of scanning it
+            with self._bus_lock:
+                accel_found = self._probe(self.ACCEL_ADDRESS, self.ACCEL_CTRL_REG1_A)
+                mag_found = self._probe(self.MAG_ADDRESS, self.MAG_IRA_REG_M)
+            if not accel_found:
+                logger.warning(f"GY511 accelerometer not found at 0x{self.ACCEL_ADDRESS:02x}")
+            if not mag_found:
+                logger.warning(f"GY511 magnetometer not found at 0x{self.MAG_ADDRESS:02x}")
+            if not (accel_found and mag_found):
+                release_bus(self.bus_number)
+                self.bus = None
+                return False
             
-            # Initialize magnetometer
-            # Set data rate to 15Hz
-            self.bus.write_byte_data(self.MAG_ADDRESS, self.MAG_CRA_REG_M, 0x10)
-            
-            # Set gain to ±1.3 gauss
-            self.bus.write_byte_data(self.MAG_ADDRESS, self.MAG_CRB_REG_M, 0x20)
+            # Register-pointer write + 6-byte read messages, reused for every sample
+            # (0x80 on the accelerometer register enables auto-increment)
+            self._accel_msgs = (i2c_msg.write(self.ACCEL_ADDRESS, [self.ACCEL_OUT_X_L_A | 0x80]),
+                                i2c_msg.read(self.ACCEL_ADDRESS, 6))
+            self._mag_msgs = (i2c_msg.write(self.MAG_ADDRESS, [self.MAG_OUT_X_H_M]),
+                              i2c_msg.read(self.MAG_ADDRESS, 6))
+            if i2c_rdwr_ioctl_data is not None:
+                self._accel_xfer = i2c_rdwr_ioctl_data.create(*self._accel_msgs)
+                self._mag_xfer = i2c_rdwr_ioctl_data.create(*self._mag_msgs)
+            else:
+                logger.warning("smbus2 ioctl struct unavailable, using bus.i2c_rdwr for sensor reads")
             
-            # Set continuous measurement mode
-            self.bus.write_byte_data(self.MAG_ADDRESS, self.MAG_MR_REG_M, 0x00)
+            with self._bus_lock:
+                # Initialize accelerometer
+                # Enable accelerometer, 50Hz, all axes
+                self.bus.write_byte_data(self.ACCEL_ADDRESS, self.ACCEL_CTRL_REG1_A, 0x47)
+                
+                # Set accelerometer scale to ±2g
+                self.bus.write_byte_data(self.ACCEL_ADDRESS, self.ACCEL_CTRL_REG4_A, 0x00)
+                
+                # Initialize magnetometer
+                # Set data rate to 75Hz
+                self.bus.write_byte_data(self.MAG_ADDRESS, self.MAG_CRA_REG_M, 0x18)
+                
+                # Set gain to ±1.3 gauss
+                self.bus.write_byte_data(self.MAG_ADDRESS, self.MAG_CRB_REG_M, 0x20)
+                
+                # Set continuous measurement mode
+                self.bus.write_byte_data(self.MAG_ADDRESS, self.MAG_MR_REG_M, 0x00)
             
             time.sleep(0.1)  # Allow sensors to stabilize
             
-            # Start reading thread
             self.running = True
-            self.thread = threading.Thread(target=self._read_loop)
-            self.thread.daemon = True
-            self.thread.start()
+            self._stop_event.clear()
+            if self.drdy_pin is not None:
+                # Read only when the magnetometer signals a new sample
+                import RPi.GPIO as GPIO
+                GPIO.setmode(GPIO.BCM)
+                GPIO.setup(self.drdy_pin, GPIO.IN)
+                GPIO.add_event_detect(self.drdy_pin, GPIO.RISING, callback=self._on_drdy)
+                # Consume any sample that became ready before the edge detector was armed
+                self._update()
+                # A failed read leaves DRDY high with no further edges; poll to re-arm it
+                self.thread = threading.Thread(target=self._drdy_watchdog)
+                self.thread.daemon = True
+                self.thread.start()
+            else:
+                # Start reading thread
+                self.thread = threading.Thread(target=self._read_loop)
+                self.thread.daemon = True
+                self.thread.start()
             
             logger.info("GY511 sensor initialized successfully")
             return True
@@ -104,120 +234,152 @@ class GY511:
             logger.error(f"Failed to initialize GY511 sensor: {e}")
             return False
     
+    def _update(self):
+        """Read both sensors and recompute the heading
+        
+        Returns False when a read failed; the previous sample is kept and not
+        re-stamped, so freshness checks see it age.
+        """
+        with self._read_lock:
+            accel_ok = self._read_accelerometer()
+            mag_ok = self._read_magnetometer()
+            if not (accel_ok and mag_ok):
+                return False
+            self._calculate_heading()
+            self.last_update = time.time()
+            self._last_read = time.monotonic()
+            return True
+    
+    def update_readings(self, max_age=0.05):
+        """Read the sensors now unless the last sample is newer than max_age seconds
+        
+        Returns True when the readings are fresh, False when the read failed.
+        """
+        if self.bus is None:
+            return False
+        if time.monotonic() - self._last_read > max_age:
+            return self._update()
+        return True
+    
+    def _on_drdy(self, channel):
+        """DRDY edge callback"""
+        if not self.running:
+            return
+        try:
+            self._update()
+        except Exception as e:
+            logger.debug(f"Error handling GY511 data ready: {e}")
+    
+    def _drdy_watchdog(self):
+        """Fallback poll for DRDY mode
+        
+        Reading the magnetometer output registers clears DRDY, so a stale sample
+        (missed edge or failed read) is re-read here to get edges flowing again.
+        """
+        while not self._stop_event.wait(self.drdy_timeout):
+            if time.monotonic() - self._last_read > self.drdy_timeout:
+                try:
+                    if self._update():
+                        logger.debug("GY511 DRDY stalled - re-armed by polling")
+                except Exception as e:
+                    logger.debug(f"Error in GY511 DRDY watchdog: {e}")
+    
     def _read_loop(self):
         """Main sensor reading loop"""
+        interval = 0.05  # 20Hz update rate
+        # Schedule against a monotonic target so loop body time doesn't accumulate as drift
+        target = time.monotonic()
         while self.running:
             try:
-                self._read_accelerometer()
-                self._read_magnetometer()
-                self._calculate_heading()
-                self.last_update = time.time()
-                time.sleep(0.1)  # 10Hz update rate
+                self._update()
+                target += interval
+                delay = target - time.monotonic()
+                if delay < 0:
+                    # Fell behind (slow bus or scheduler stall): resync instead of bursting
+                    target = time.monotonic()
+                    delay = 0
+                self._stop_event.wait(delay)
                 
             except Exception as e:
                 logger.debug(f"Error in GY511 read loop: {e}")
-                time.sleep(0.5)
+                self._stop_event.wait(0.5)
+                target = time.monotonic()
+    
+    def _apply_calibration(self):
+        """Snapshot offsets and scales into the tuple used on every sample"""
+        self._mag_cal = (self.mag_offset_x, self.mag_offset_y, self.mag_offset_z,
+                         self.mag_scale_x, self.mag_scale_y, self.mag_scale_z)
     
-    def _read_accelerometer(self):
+    def _read_accelerometer(self, _unpack=_ACCEL_SAMPLE.unpack):
         """Read accelerometer data"""
         try:
-            # Read 6 bytes starting from X low register
-            data = self.bus.read_i2c_block_data(self.ACCEL_ADDRESS, 
-                                              self.ACCEL_OUT_X_L_A | 0x80, 6)
+            with self._bus_lock:
+                if self._accel_xfer is not None:
+                    ioctl(self.bus.fd, I2C_RDWR, self._accel_xfer)
+                else:
+                    self.bus.i2c_rdwr(*self._accel_msgs)
             
-            # Convert to signed 16-bit values
-            self.accel_x = self._to_signed_16(data[1] << 8 | data[0])
-            self.accel_y = self._to_signed_16(data[3] << 8 | data[2])
-            self.accel_z = self._to_signed_16(data[5] << 8 | data[4])
+            # Signed 16-bit values, little-endian X, Y, Z
+            self.accel_x, self.accel_y, self.accel_z = _unpack(bytes(self._accel_msgs[1]))
+            return True
             
         except Exception as e:
             logger.debug(f"Error reading accelerometer: {e}")
+            return False
     
-    def _read_magnetometer(self):
+    def _read_magnetometer(self, _unpack=_MAG_SAMPLE.unpack):
         """Read magnetometer data"""
         try:
-            # Read 6 bytes starting from X high register
-            data = self.bus.read_i2c_block_data(self.MAG_ADDRESS, self.MAG_OUT_X_H_M, 6)
+            with self._bus_lock:
+                if self._mag_xfer is not None:
+                    ioctl(self.bus.fd, I2C_RDWR, self._mag_xfer)
+                else:
+                    self.bus.i2c_rdwr(*self._mag_msgs)
             
-            # Convert to signed 16-bit values (magnetometer is big-endian)
-            self.mag_x = self._to_signed_16(data[0] << 8 | data[1])
-            self.mag_z = self._to_signed_16(data[2] << 8 | data[3])  # Z comes before Y
-            self.mag_y = self._to_signed_16(data[4] << 8 | data[5])
+            # Signed 16-bit values, big-endian, Z comes before Y
+            mag_x, mag_z, mag_y = _unpack(bytes(self._mag_msgs[1]))
+            self._mag_raw = (mag_x, mag_y, mag_z)
             
             # Apply calibration
-            self.mag_x = (self.mag_x - self.mag_offset_x) * self.mag_scale_x
-            self.mag_y = (self.mag_y - self.mag_offset_y) * self.mag_scale_y
-            self.mag_z = (self.mag_z - self.mag_offset_z) * self.mag_scale_z
+            off_x, off_y, off_z, scale_x, scale_y, scale_z = self._mag_cal
+            self.mag_x = (mag_x - off_x) * scale_x
+            self.mag_y = (mag_y - off_y) * scale_y
+            self.mag_z = (mag_z - off_z) * scale_z
+            return True
             
         except Exception as e:
             logger.debug(f"Error reading magnetometer: {e}")
-    
-    def _to_signed_16(self, value):
-        """Convert unsigned 16-bit to signed"""
-        if value > 32767:
-            return value - 65536
-        return value
+            return False
     
     def _calculate_heading(self):
         """Calculate compass heading with tilt compensation"""
-        try:
-            # Simple heading calculation (no tilt compensation)
-            heading_rad = math.atan2(self.mag_y, self.mag_x)
-            heading_deg = math.degrees(heading_rad)
-            
-            # Normalize to 0-360 degrees
-            if heading_deg < 0:
-                heading_deg += 360
-            
-            self.heading = heading_deg
-            
-            # Tilt-compensated heading calculation
-            if self.accel_x != 0 or self.accel_y != 0 or self.accel_z != 0:
-                # Normalize accelerometer readings
-                accel_norm = math.sqrt(self.accel_x**2 + self.accel_y**2 + self.accel_z**2)
-                if accel_norm > 0:
-                    ax_norm = self.accel_x / accel_norm
-                    ay_norm = self.accel_y / accel_norm
-                    az_norm = self.accel_z / accel_norm
-                    
-                    # Calculate roll and pitch
-                    roll = math.atan2(ay_norm, az_norm)
-                    pitch = math.atan2(-ax_norm, math.sqrt(ay_norm**2 + az_norm**2))
-                    
-                    # Tilt compensation
-                    mag_x_comp = (self.mag_x * math.cos(pitch) + 
-                                 self.mag_z * math.sin(pitch))
-                    mag_y_comp = (self.mag_x * math.sin(roll) * math.sin(pitch) + 
-                                 self.mag_y * math.cos(roll) - 
-                                 self.mag_z * math.sin(roll) * math.cos(pitch))
-                    
-                    # Calculate tilt-compensated heading
-                    tilt_heading_rad = math.atan2(mag_y_comp, mag_x_comp)
-                    tilt_heading_deg = math.degrees(tilt_heading_rad)
-                    
-                    # Normalize to 0-360 degrees
-                    if tilt_heading_deg < 0:
-                        tilt_heading_deg += 360
-                    
-                    self.tilt_compensated_heading = tilt_heading_deg
-                else:
-                    self.tilt_compensated_heading = self.heading
-            else:
-                self.tilt_compensated_heading = self.heading
-            
-            # Apply smoothing
-            self.heading_history.append(self.tilt_compensated_heading)
-            
-        except Exception as e:
-            logger.debug(f"Error calculating heading: {e}")
+        # No try/except: _tilt_heading only uses atan2/sqrt and guards the zero-norm case
+        self.heading, self.tilt_compensated_heading, sample = _tilt_heading(
+            self.accel_x, self.accel_y, self.accel_z,
+            self.mag_x, self.mag_y, self.mag_z)
+        
+        # Apply smoothing
+        if self._heading_ready:
+            alpha = self.heading_alpha
+            beta = 1.0 - alpha
+            self._heading_sin = alpha * self._heading_sin + beta * sample[0]
+            self._heading_cos = alpha * self._heading_cos + beta * sample[1]
+        else:
+            self._heading_sin, self._heading_cos = sample
+            self._heading_ready = True
     
     def get_heading(self):
         """Get current compass heading (smoothed, tilt-compensated)"""
-        if not self.heading_history:
+        if not self._heading_ready:
             return None
         
-        # Return smoothed heading
-        return sum(self.heading_history) / len(self.heading_history)
+        # Return smoothed heading (blended as vectors, so 359° and 1° blend to 0°)
+        return math.degrees(math.atan2(self._heading_sin, self._heading_cos)) % 360.0
+    
+    def get_compass_heading(self):
+        """Get smoothed heading, refreshing the sample only if it is stale"""
+        self.update_readings()
+        return self.get_heading()
     
     def get_raw_heading(self):
         """Get raw compass heading (no tilt compensation)"""
@@ -246,21 +408,25 @@ class GY511:
         logger.info(f"Starting magnetometer calibration for {duration} seconds...")
         logger.info("Rotate the device in all directions during calibration")
         
-        min_x = min_y = min_z = float('inf')
-        max_x = max_y = max_z = float('-inf')
+        # Collect raw samples; the min/max reduction runs once at the end
+        samples = np.empty((int(duration * 10) + 1, 3), dtype=np.int16)
+        count = 0
         
-        start_time = time.time()
+        start_time = time.monotonic()
+        target = start_time
         
-        while time.time() - start_time < duration:
-            # Update min/max values
-            min_x = min(min_x, self.mag_x)
-            max_x = max(max_x, self.mag_x)
-            min_y = min(min_y, self.mag_y)
-            max_y = max(max_y, self.mag_y)
-            min_z = min(min_z, self.mag_z)
-            max_z = max(max_z, self.mag_z)
-            
-            time.sleep(0.1)
+        while time.monotonic() - start_time < duration and count < len(samples):
+            samples[count] = self._mag_raw
+            count += 1
+            target += 0.1
+            time.sleep(max(0.0, target - time.monotonic()))
+        
+        if count == 0:
+            logger.warning("No magnetometer samples collected - calibration unchanged")
+            return
+        
+        min_x, min_y, min_z = samples[:count].min(axis=0).tolist()
+        max_x, max_y, max_z = samples[:count].max(axis=0).tolist()
         
         # Calculate offsets and scales
         self.mag_offset_x = (max_x + min_x) / 2
@@ -276,6 +442,7 @@ class GY511:
         self.mag_scale_x = avg_range / range_x if range_x > 0 else 1.0
         self.mag_scale_y = avg_range / range_y if range_y > 0 else 1.0
         self.mag_scale_z = avg_range / range_z if range_z > 0 else 1.0
+        self._apply_calibration()
         
         logger.info("Magnetometer calibration completed")
         logger.info(f"Offsets: X={self.mag_offset_x:.2f}, Y={self.mag_offset_y:.2f}, Z={self.mag_offset_z:.2f}")
@@ -284,20 +451,26 @@ class GY511:
     def is_data_valid(self):
         """Check if sensor data is valid and recent"""
         return (self.last_update > 0 and 
-                time.time() - self.last_update < 2.0)  # Data should be less than 2 seconds old
+                time.monotonic() - self._last_read < 2.0)  # Data should be less than 2 seconds old
     
     def cleanup(self):
         """Stop sensor and cleanup"""
         self.running = False
+        self._stop_event.set()
         if self.thread:
             self.thread.join(timeout=1.0)
         
-        if self.bus:
+        if self.drdy_pin is not None:
             try:
-                self.bus.close()
-            except:
+                import RPi.GPIO as GPIO
+                GPIO.remove_event_detect(self.drdy_pin)
+            except Exception:
                 pass
         
+        if self.bus:
+            release_bus(self.bus_number)
+            self.bus = None
+        
         logger.info("GY511 sensor cleanup completed")
 
 def main():
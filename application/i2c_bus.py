@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Shared I2C Bus
+==============
+Process-wide smbus2 handles so every sensor driver on the same bus shares
+one file descriptor and one lock for its transactions.
+"""
+
+import logging
+import threading
+from smbus2 import SMBus
+
+logger = logging.getLogger(__name__)
+
+# bus_number -> [SMBus, transaction lock, reference count]
+_buses = {}
+_registry_lock = threading.Lock()
+
+def get_bus(bus_number=1):
+    """Return the shared SMBus for bus_number, opening it on first use"""
+    with _registry_lock:
+        entry = _buses.get(bus_number)
+        if entry is None:
+            entry = [SMBus(bus_number), threading.Lock(), 0]
+            _buses[bus_number] = entry
+            logger.info(f"Opened I2C bus {bus_number}")
+        entry[2] += 1
+        return entry[0]
+
+def get_lock(bus_number=1):
+    """Return the lock that serializes transactions on bus_number"""
+    with _registry_lock:
+        return _buses[bus_number][1]
+
+def release_bus(bus_number=1):
+    """Drop one reference to bus_number and close it when the last user releases it"""
+    with _registry_lock:
+        entry = _buses.get(bus_number)
+        if entry is None:
+            return
+        entry[2] -= 1
+        if entry[2] <= 0:
+            del _buses[bus_number]
+            try:
+                entry[0].close()
+            except Exception:
+                pass
+            logger.info(f"Closed I2C bus {bus_number}")
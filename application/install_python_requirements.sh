@@ -65,7 +65,7 @@ else
     echo "Installing hardware-specific packages..."
     
     # smbus2 (alternative to system python3-smbus)
-    python3 -m pip install smbus2>=0.4.0 || echo "Warning: smbus2 installation failed, using system package"
+    python3 -m pip install 'smbus2>=0.4.0,<0.7' || echo "Warning: smbus2 installation failed, using system package"
     
     # spidev (alternative to system python3-spidev)
     python3 -m pip install spidev>=3.5 || echo "Warning: spidev installation failed, using system package"
@@ -10,55 +10,254 @@ import sqlite3
 import math
 import logging
 import os
+import struct
+import queue
+import threading
+import weakref
+import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 from io import BytesIO
 import json
 
 logger = logging.getLogger(__name__)
 
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Layout version of the assets folder's file summary cache; bump when summaries change
+META_CACHE_VERSION = 1
+
+# MBTiles metadata 'format' values and the PIL decoder for each
+TILE_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+# Encoder settings per output format, favouring speed over size
+ENCODE_OPTIONS = {
+    'PNG': {'compress_level': 1},
+    'JPEG': {'quality': 85},
+    'WEBP': {'quality': 85, 'method': 0},
+}
+
+# Region bounds are bucketed into a grid of cells this many degrees wide
+GRID_CELL_DEGREES = 1.0
+
+# Coordinates outside every region are remembered per cell of this many degrees
+# (about 1 km), up to MISS_CACHE_SIZE cells
+MISS_CELL_DEGREES = 0.01
+MISS_CACHE_SIZE = 256
+
+def deg2num(lat_deg, lon_deg, zoom, _radians=math.radians, _asinh=math.asinh,
+            _tan=math.tan, _pi=math.pi):
+    """Convert lat/lon to XYZ tile numbers"""
+    n = float(1 << zoom)
+    x = int((lon_deg + 180.0) / 360.0 * n)
+    y = int((1.0 - _asinh(_tan(_radians(lat_deg))) / _pi) / 2.0 * n)
+    return (x, y)
+
+def num2deg(x, y, zoom, _atan=math.atan, _sinh=math.sinh, _degrees=math.degrees,
+            _pi=math.pi):
+    """Convert XYZ tile numbers to lat/lon (tile north-west corner)"""
+    n = float(1 << zoom)
+    lon_deg = x / n * 360.0 - 180.0
+    lat_deg = _degrees(_atan(_sinh(_pi * (1 - 2 * y / n))))
+    return (lat_deg, lon_deg)
+
+def deg2num_vec(lat_deg, lon_deg, zoom):
+    """Convert arrays of lat/lon to arrays of XYZ tile numbers"""
+    n = 1 << zoom
+    lat_rad = np.radians(np.asarray(lat_deg, dtype=np.float64))
+    x = ((np.asarray(lon_deg, dtype=np.float64) + 180.0) * (n / 360.0)).astype(np.int64)
+    y = ((1.0 - np.arcsinh(np.tan(lat_rad)) / np.pi) * (n / 2.0)).astype(np.int64)
+    return x, y
+
+def num2deg_vec(x, y, zoom):
+    """Convert arrays of XYZ tile numbers to arrays of lat/lon (tile north-west corners)"""
+    n = float(1 << zoom)
+    lon_deg = np.asarray(x, dtype=np.float64) * (360.0 / n) - 180.0
+    lat_rad = np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(y, dtype=np.float64) / n)))
+    return np.degrees(lat_rad), lon_deg
+
+# Prebuilt placeholder tiles keyed by tile size
+_placeholder_tiles = {}
+
+def _placeholder_tile(size=256):
+    """Get the read-only placeholder tile pixels for a tile size"""
+    tile = _placeholder_tiles.get(size)
+    if tile is None:
+        # Light gray fill
+        tile = np.full((size, size, 3), 220, dtype=np.uint8)
+        
+        # Border
+        tile[0, :] = tile[-1, :] = 180
+        tile[:, 0] = tile[:, -1] = 180
+        
+        # Diagonal lines
+        idx = np.arange(size)
+        tile[idx, idx] = 180
+        tile[idx, size - 1 - idx] = 180
+        
+        tile.flags.writeable = False
+        _placeholder_tiles[size] = tile
+    return tile
+
+class TileCache:
+    """Thread-safe LRU of per-tile values shared by every open reader
+    
+    Keys are (filepath, z, x, y), so one memory budget covers all MBTiles files.
+    """
+    
+    def __init__(self, max_tiles=160):
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        # The prefetch threads fill the cache while rendering reads it
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Look up a tile and mark it as recently used"""
+        with self._lock:
+            value = self._tiles.get(key)
+            if value is not None:
+                self._tiles.move_to_end(key)
+        return value
+    
+    def put(self, key, value):
+        """Store a tile, evicting the least recently used ones if full"""
+        with self._lock:
+            self._tiles[key] = value
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+    
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._tiles
+    
+    def drop(self, filepath):
+        """Remove every tile belonging to one MBTiles file"""
+        with self._lock:
+            for key in [key for key in self._tiles if key[0] == filepath]:
+                del self._tiles[key]
+    
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+
+# About 30 MB of 256 px RGB tiles, whichever files they come from
+_decoded_tiles = TileCache(160)
+
+# Encoded tile blobs as stored, so tiles evicted above are re-decoded without a query
+_encoded_tiles = TileCache(512)
+
 class MBTilesReader:
     """Enhanced MBTiles file reader with smart tile handling"""
     
-    def __init__(self, filepath):
+    # Fixed SQL text so each connection's statement cache reuses the prepared statements
+    TILE_SQL = "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?"
+    TILE_RANGE_SQL = ("SELECT tile_column, tile_row, tile_data FROM tiles "
+                      "WHERE zoom_level=? AND tile_column BETWEEN ? AND ? "
+                      "AND tile_row BETWEEN ? AND ?")
+    
+    # Highest tile row per zoom level, for flipping between XYZ and TMS rows
+    _z_mask = tuple((1 << z) - 1 for z in range(32))
+    
+    def __init__(self, filepath, pool_size=2, tile_cache=None):
         self.filepath = filepath
         self.filename = Path(filepath).name
-        self.conn = None
+        # Pool of read-only connections shared by render and worker threads
+        self.pool_size = pool_size
+        self._pool = None
         self.metadata = {}
         self.bounds = None
+        # Bounds as plain floats for contains_coordinates; NaN compares false until known
+        self._west = self._south = self._east = self._north = math.nan
         self.min_zoom = 0
         self.max_zoom = 18
+        self.tile_format = 'png'
+        # PIL formats tried when decoding, so Image.open skips sniffing every plugin
+        self._decode_formats = ('PNG',)
         self.center_lat = 0
         self.center_lon = 0
         self.name = self.filename
         
+        # Zoom levels present in the tiles table, read once at open
+        self._available_zooms = ()
+        self._zoom_set = frozenset()
+        
+        # Decoded tile cache, shared with the other readers unless one is given
+        self._tile_cache = tile_cache if tile_cache is not None else _decoded_tiles
+        self._blob_cache = _encoded_tiles
+        
+        # Reusable composite canvases keyed by shape, and PNG output buffers
+        self._canvas_pool = {}
+        self._output_pool = []
+        self._buffer_lock = threading.Lock()
+        
+        # Worker threads for PNG/JPEG decoding (PIL releases the GIL while decoding)
+        self._decode_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1),
+                                               thread_name_prefix="tile-decode")
+        
+        # Single background worker warming the tile cache around the last view
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1,
+                                                     thread_name_prefix="tile-prefetch")
+        self._prefetch_future = None
+        
         # Open and read metadata
         self._open_database()
         self._read_metadata()
+        self._load_zoom_levels()
+    
+    def _open_connection(self):
+        """Open one read-only SQLite connection"""
+        # Read-only, immutable URI: tile packs never change while mounted, so SQLite
+        # skips file locking and change detection entirely
+        uri = Path(self.filepath).resolve().as_uri() + "?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               isolation_level=None, cached_statements=256)
+        
+        # Tuned for a read-only point-lookup workload; 64 MB page cache split across the pool
+        conn.execute("PRAGMA query_only=1")
+        conn.execute(f"PRAGMA cache_size=-{65536 // self.pool_size}")
+        conn.execute("PRAGMA mmap_size=268435456")    # map up to 256 MB of the file
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
     
     def _open_database(self):
-        """Open SQLite database connection"""
+        """Open the SQLite connection pool"""
         try:
-            self.conn = sqlite3.connect(self.filepath)
-            self.conn.row_factory = sqlite3.Row
+            # LIFO, so the most recently used connection (warmest page cache) is reused first
+            self._pool = queue.LifoQueue()
+            for _ in range(self.pool_size):
+                self._pool.put(self._open_connection())
             logger.debug(f"Opened MBTiles file: {self.filename}")
         except Exception as e:
             logger.error(f"Failed to open MBTiles file {self.filepath}: {e}")
+            self.close()
             raise
     
+    @contextmanager
+    def _borrow(self):
+        """Borrow a connection from the pool for the duration of a with block"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+    
     def _read_metadata(self):
         """Read metadata from MBTiles file"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT name, value FROM metadata")
-            
-            for row in cursor.fetchall():
-                self.metadata[row['name']] = row['value']
+            with self._borrow() as conn:
+                # Rows are plain (name, value) tuples; build the mapping straight from the cursor
+                meta = dict(conn.execute("SELECT name, value FROM metadata"))
+            self.metadata = meta
             
             # Parse important metadata
-            if 'bounds' in self.metadata:
-                bounds_str = self.metadata['bounds']
+            bounds_str = meta.get('bounds')
+            if bounds_str:
                 bounds = [float(x) for x in bounds_str.split(',')]
+                self._west, self._south, self._east, self._north = bounds[:4]
                 self.bounds = {
                     'west': bounds[0],
                     'south': bounds[1], 
@@ -70,14 +269,19 @@ class MBTilesReader:
                 self.center_lat = (bounds[1] + bounds[3]) / 2
                 self.center_lon = (bounds[0] + bounds[2]) / 2
             
-            if 'minzoom' in self.metadata:
-                self.min_zoom = int(self.metadata['minzoom'])
+            min_zoom = meta.get('minzoom')
+            if min_zoom is not None:
+                self.min_zoom = int(min_zoom)
             
-            if 'maxzoom' in self.metadata:
-                self.max_zoom = int(self.metadata['maxzoom'])
+            max_zoom = meta.get('maxzoom')
+            if max_zoom is not None:
+                self.max_zoom = int(max_zoom)
             
-            if 'name' in self.metadata:
-                self.name = self.metadata['name']
+            self.name = meta.get('name', self.name)
+            
+            self.tile_format = meta.get('format', self.tile_format).lower()
+            pil_format = TILE_FORMATS.get(self.tile_format)
+            self._decode_formats = (pil_format,) if pil_format else None
             
             logger.debug(f"MBTiles metadata loaded for {self.filename}: "
                         f"bounds={self.bounds}, zoom={self.min_zoom}-{self.max_zoom}")
@@ -87,88 +291,230 @@ class MBTilesReader:
     
     def contains_coordinates(self, lat, lon):
         """Check if coordinates are within this MBTiles bounds"""
-        if not self.bounds:
-            return False
-        
-        return (self.bounds['south'] <= lat <= self.bounds['north'] and
-                self.bounds['west'] <= lon <= self.bounds['east'])
-    
-    def get_distance_to_center(self, lat, lon):
-        """Calculate distance from coordinates to center of this MBTiles region"""
-        # Simple distance calculation
-        lat_diff = lat - self.center_lat
-        lon_diff = lon - self.center_lon
-        return math.sqrt(lat_diff**2 + lon_diff**2)
+        return self._south <= lat <= self._north and self._west <= lon <= self._east
     
     def deg2num(self, lat_deg, lon_deg, zoom):
         """Convert lat/lon to tile numbers"""
-        lat_rad = math.radians(lat_deg)
-        n = 2.0 ** zoom
-        x = int((lon_deg + 180.0) / 360.0 * n)
-        y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
-        return (x, y)
+        return deg2num(lat_deg, lon_deg, zoom)
     
     def num2deg(self, x, y, zoom):
         """Convert tile numbers to lat/lon"""
-        n = 2.0 ** zoom
-        lon_deg = x / n * 360.0 - 180.0
-        lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * y / n)))
-        lat_deg = math.degrees(lat_rad)
-        return (lat_deg, lon_deg)
+        return num2deg(x, y, zoom)
     
     def get_tile(self, z, x, y):
         """Get tile data from MBTiles file"""
+        key = (self.filepath, z, x, y)
+        tile_data = self._blob_cache.get(key)
+        if tile_data is not None:
+            return tile_data
         try:
-            cursor = self.conn.cursor()
             # MBTiles uses TMS scheme, need to flip Y coordinate
-            tms_y = (2**z - 1) - y
-            cursor.execute("SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?", 
-                          (z, x, tms_y))
-            row = cursor.fetchone()
+            tms_y = self._z_mask[z] - y
+            with self._borrow() as conn:
+                row = conn.execute(self.TILE_SQL, (z, x, tms_y)).fetchone()
             
-            if row:
-                return row['tile_data']
-            else:
+            if row is None:
                 return None
+            self._blob_cache.put(key, row[0])
+            return row[0]
                 
         except Exception as e:
             logger.debug(f"Error getting tile {z}/{x}/{y}: {e}")
             return None
     
-    def get_available_zoom_levels(self):
-        """Get list of available zoom levels"""
+    def get_tiles_range(self, z, x0, x1, y0, y1):
+        """Get all tiles in an inclusive XYZ tile range with one query
+        
+        Returns a dict mapping (x, y) in XYZ scheme to tile data.
+        """
+        try:
+            # MBTiles uses TMS scheme, flip the Y range
+            flip = self._z_mask[z]
+            with self._borrow() as conn:
+                cursor = conn.cursor()
+                cursor.arraysize = (x1 - x0 + 1) * (y1 - y0 + 1)
+                cursor.execute(self.TILE_RANGE_SQL, (z, x0, x1, flip - y1, flip - y0))
+                rows = cursor.fetchall()
+            return {(row[0], flip - row[1]): row[2] for row in rows}
+            
+        except Exception as e:
+            logger.debug(f"Error getting tiles {z}/{x0}-{x1}/{y0}-{y1}: {e}")
+            return {}
+    
+    def get_tiles(self, z, keys):
+        """Get specific tiles, given as XYZ (x, y) keys, with one query
+        
+        Returns a dict mapping (x, y) in XYZ scheme to tile data.
+        """
+        if not keys:
+            return {}
+        try:
+            flip = self._z_mask[z]
+            params = [z]
+            for x, y in keys:
+                params += (x, flip - y)
+            sql = ("SELECT tile_column, tile_row, tile_data FROM tiles WHERE zoom_level=? "
+                   "AND (tile_column, tile_row) IN (VALUES " + ",".join(["(?,?)"] * len(keys)) + ")")
+            with self._borrow() as conn:
+                rows = conn.execute(sql, params).fetchall()
+            return {(row[0], flip - row[1]): row[2] for row in rows}
+            
+        except Exception as e:
+            logger.debug(f"Error getting {len(keys)} tiles at zoom {z}: {e}")
+            return {}
+    
+    def _decode_tile(self, tile_data, tile_size=256):
+        """Decode tile data into an RGB pixel array ready for slice assignment"""
+        try:
+            image = Image.open(BytesIO(tile_data), formats=self._decode_formats)
+        except UnidentifiedImageError:
+            # Tile stored in a different format than the metadata declares
+            image = Image.open(BytesIO(tile_data))
+        image = image.convert('RGB')
+        if image.size != (tile_size, tile_size):
+            image = image.resize((tile_size, tile_size))
+        return np.asarray(image)
+    
+    def _try_decode_tile(self, tile_data, tile_size=256):
+        """Decode tile data, returning (pixels, None) or (None, error)"""
+        try:
+            return self._decode_tile(tile_data, tile_size), None
+        except Exception as e:
+            return None, e
+    
+    def _cache_get(self, key):
+        """Look up a decoded (z, x, y) tile of this file"""
+        return self._tile_cache.get((self.filepath,) + key)
+    
+    def _cache_put(self, key, image):
+        """Store a decoded (z, x, y) tile of this file"""
+        self._tile_cache.put((self.filepath,) + key, image)
+    
+    def _prefetch_tiles(self, z, x0, x1, y0, y1):
+        """Decode uncached tiles of an inclusive XYZ range into the tile cache"""
+        try:
+            missing = [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)
+                       if (self.filepath, z, x, y) not in self._tile_cache]
+            if not missing:
+                return
+            
+            tiles = self.get_tiles_range(z, x0, x1, y0, y1)
+            for x, y in missing:
+                tile_data = tiles.get((x, y))
+                if tile_data:
+                    pixels, error = self._try_decode_tile(tile_data)
+                    if error is None:
+                        self._cache_put((z, x, y), pixels)
+                        
+        except Exception as e:
+            logger.debug(f"Error prefetching tiles {z}/{x0}-{x1}/{y0}-{y1}: {e}")
+    
+    def _schedule_prefetch(self, z, x0, x1, y0, y1):
+        """Queue a background prefetch, dropping one that has not started yet"""
+        if self._prefetch_future is not None:
+            self._prefetch_future.cancel()
+        self._prefetch_future = self._prefetch_executor.submit(
+            self._prefetch_tiles, z, x0, x1, y0, y1)
+    
+    def _acquire_canvas(self, height, width):
+        """Get a background-filled composite canvas, reusing a pooled one when possible"""
+        with self._buffer_lock:
+            free = self._canvas_pool.get((height, width))
+            canvas = free.pop() if free else None
+        if canvas is None:
+            canvas = np.empty((height, width, 3), dtype=np.uint8)
+        canvas.fill(240)
+        return canvas
+    
+    def _release_canvas(self, canvas):
+        """Return a canvas to the pool once its pixels have been copied out"""
+        with self._buffer_lock:
+            self._canvas_pool.setdefault(canvas.shape[:2], []).append(canvas)
+    
+    def _encode_image(self, image, output_format='PNG'):
+        """Encode an image using a pooled output buffer"""
+        with self._buffer_lock:
+            output = self._output_pool.pop() if self._output_pool else BytesIO()
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT DISTINCT zoom_level FROM tiles ORDER BY zoom_level")
-            return [row[0] for row in cursor.fetchall()]
+            output.seek(0)
+            output.truncate(0)
+            image.save(output, format=output_format, **ENCODE_OPTIONS.get(output_format, {}))
+            return output.getvalue()
+        finally:
+            with self._buffer_lock:
+                self._output_pool.append(output)
+    
+    def get_tile_image(self, z, x, y):
+        """Get decoded tile image, served from the tile cache when possible"""
+        pixels = self._cache_get((z, x, y))
+        if pixels is None:
+            tile_data = self.get_tile(z, x, y)
+            if not tile_data:
+                return None
+            try:
+                pixels = self._decode_tile(tile_data)
+            except Exception as e:
+                logger.debug(f"Error loading tile image {z}/{x}/{y}: {e}")
+                return None
+            self._cache_put((z, x, y), pixels)
+        return Image.fromarray(pixels)
+    
+    def _load_zoom_levels(self):
+        """Scan the tiles table once for the zoom levels it contains"""
+        try:
+            with self._borrow() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT DISTINCT zoom_level FROM tiles ORDER BY zoom_level")
+                zooms = tuple(row[0] for row in cursor.fetchall())
         except Exception as e:
             logger.error(f"Error getting zoom levels: {e}")
-            return list(range(self.min_zoom, self.max_zoom + 1))
+            zooms = ()
+        
+        if not zooms:
+            zooms = tuple(range(self.min_zoom, self.max_zoom + 1))
+        
+        self._available_zooms = zooms
+        self._zoom_set = frozenset(zooms)
+    
+    def get_available_zoom_levels(self):
+        """Get list of available zoom levels"""
+        return list(self._available_zooms)
     
     def find_best_zoom(self, target_zoom):
         """Find the best available zoom level for target zoom"""
-        available_zooms = self.get_available_zoom_levels()
-        
-        if target_zoom in available_zooms:
+        if target_zoom in self._zoom_set:
             return target_zoom
         
         # Find closest zoom level
-        closest_zoom = min(available_zooms, key=lambda x: abs(x - target_zoom))
+        closest_zoom = min(self._available_zooms, key=lambda x: abs(x - target_zoom))
         return closest_zoom
     
     def generate_composite_image(self, center_lat, center_lon, zoom, width, height, 
-                               use_fallback=True, crop_to_size=True):
-        """Generate composite image from tiles with enhanced fallback handling"""
+                               use_fallback=True, crop_to_size=True, output_format='PNG'):
+        """Generate composite image from tiles with enhanced fallback handling
+        
+        output_format is 'PNG' (default), 'JPEG' or 'WEBP'; None returns the
+        RGB PIL image itself for in-process callers that would decode it again.
+        """
+        output_format = output_format.upper() if output_format else None
         try:
             # Find best available zoom
             actual_zoom = self.find_best_zoom(zoom)
-            zoom_adjusted = actual_zoom != zoom
             
             # Calculate tile coverage needed
             center_x, center_y = self.deg2num(center_lat, center_lon, actual_zoom)
             
-            # Calculate how many tiles we need
             tile_size = 256
+            
+            # A single centered tile at native size, already stored in the requested
+            # format, needs no decode or re-encode
+            if output_format and crop_to_size and width == tile_size and height == tile_size:
+                tile_data = self.get_tile(actual_zoom, center_x, center_y)
+                if self._stored_format(tile_data, tile_size) == output_format:
+                    return tile_data, self._composite_metadata(
+                        zoom, actual_zoom, 1, 0, center_lat, center_lon, width, height)
+            
+            # Calculate how many tiles we need
             tiles_x = math.ceil(width / tile_size) + 1
             tiles_y = math.ceil(height / tile_size) + 1
             
@@ -187,71 +533,99 @@ class MBTilesReader:
             start_y = center_y - half_tiles_y
             end_y = center_y + half_tiles_y + 1
             
-            # Create composite image
+            # Allocate only the output window: the centered crop of the tile grid,
+            # or the whole grid when not cropping
             composite_width = tiles_x * tile_size
             composite_height = tiles_y * tile_size
-            composite = Image.new('RGB', (composite_width, composite_height), (240, 240, 240))
+            if crop_to_size:
+                left = (composite_width - width) // 2
+                top = (composite_height - height) // 2
+                canvas = self._acquire_canvas(height, width)
+                
+                # Only fetch and decode the tiles overlapping the crop
+                skip_x, left = divmod(left, tile_size)
+                skip_y, top = divmod(top, tile_size)
+                start_x += skip_x
+                start_y += skip_y
+                end_x = start_x + (left + width - 1) // tile_size + 1
+                end_y = start_y + (top + height - 1) // tile_size + 1
+            else:
+                left = top = 0
+                canvas = self._acquire_canvas(composite_height, composite_width)
             
             tiles_found = 0
             tiles_missing = 0
             
+            # Take decoded tiles from the cache; query the database only on a miss
+            cached = {(tx, ty): self._cache_get((actual_zoom, tx, ty))
+                      for ty in range(start_y, end_y) for tx in range(start_x, end_x)}
+            
+            # Fetch what is still missing, preferring encoded blobs still in memory:
+            # a cold window is one range scan, otherwise just the missing keys
+            misses = [key for key, pixels in cached.items() if pixels is None]
+            tiles = {}
+            for key in misses:
+                tile_data = self._blob_cache.get((self.filepath, actual_zoom) + key)
+                if tile_data is not None:
+                    tiles[key] = tile_data
+            if len(tiles) < len(misses):
+                if not tiles and len(misses) == len(cached):
+                    fetched = self.get_tiles_range(actual_zoom, start_x, end_x - 1, start_y, end_y - 1)
+                else:
+                    fetched = self.get_tiles(actual_zoom, [key for key in misses if key not in tiles])
+                for key, tile_data in fetched.items():
+                    self._blob_cache.put((self.filepath, actual_zoom) + key, tile_data)
+                tiles.update(fetched)
+            
+            # Decode the fetched tiles in parallel; a lone tile (typical after a
+            # short pan) is decoded inline to skip the worker hand-off
+            pending = [key for key, pixels in cached.items() if pixels is None and tiles.get(key)]
+            decode = lambda key: self._try_decode_tile(tiles[key], tile_size)
+            if len(pending) > 1:
+                decoded = dict(zip(pending, self._decode_pool.map(decode, pending)))
+            else:
+                decoded = {key: decode(key) for key in pending}
+            
             # Load and place tiles
             for ty in range(start_y, end_y):
                 for tx in range(start_x, end_x):
-                    tile_data = self.get_tile(actual_zoom, tx, ty)
+                    # Calculate position in the output window (may be partly outside it)
+                    pos_x = (tx - start_x) * tile_size - left
+                    pos_y = (ty - start_y) * tile_size - top
+                    
+                    pixels = cached[(tx, ty)]
                     
-                    if tile_data:
-                        try:
-                            tile_image = Image.open(BytesIO(tile_data))
-                            
-                            # Calculate position in composite
-                            pos_x = (tx - start_x) * tile_size
-                            pos_y = (ty - start_y) * tile_size
-                            
-                            composite.paste(tile_image, (pos_x, pos_y))
-                            tiles_found += 1
-                            
-                        except Exception as e:
-                            logger.debug(f"Error loading tile image {actual_zoom}/{tx}/{ty}: {e}")
-                            self._draw_placeholder_tile(composite, (tx - start_x) * tile_size, 
-                                                      (ty - start_y) * tile_size, tile_size)
+                    if pixels is None and (tx, ty) in decoded:
+                        pixels, error = decoded[(tx, ty)]
+                        if error is not None:
+                            logger.debug(f"Error loading tile image {actual_zoom}/{tx}/{ty}: {error}")
+                            self._draw_placeholder_tile(canvas, pos_x, pos_y, tile_size)
                             tiles_missing += 1
+                            continue
+                        self._cache_put((actual_zoom, tx, ty), pixels)
+                    
+                    if pixels is not None:
+                        self._blit(canvas, pixels, pos_x, pos_y)
+                        tiles_found += 1
                     else:
                         # Create placeholder tile
                         if use_fallback:
-                            self._draw_placeholder_tile(composite, (tx - start_x) * tile_size, 
-                                                      (ty - start_y) * tile_size, tile_size)
+                            self._draw_placeholder_tile(canvas, pos_x, pos_y, tile_size)
                         tiles_missing += 1
             
-            # Crop to requested size if needed
-            if crop_to_size and (composite.width != width or composite.height != height):
-                # Calculate crop area to center the image
-                left = (composite.width - width) // 2
-                top = (composite.height - height) // 2
-                right = left + width
-                bottom = top + height
-                
-                composite = composite.crop((left, top, right, bottom))
+            # fromarray copies RGB pixels, so the canvas can go straight back to the pool
+            composite = Image.fromarray(canvas)
+            self._release_canvas(canvas)
             
             # Convert to bytes
-            output = BytesIO()
-            composite.save(output, format='PNG')
-            image_data = output.getvalue()
+            image_data = self._encode_image(composite, output_format) if output_format else composite
+            
+            # Warm the cache with a one-tile ring around this view for the next pan
+            self._schedule_prefetch(actual_zoom, start_x - 1, end_x, start_y - 1, end_y)
             
             # Prepare metadata
-            metadata = {
-                'zoom_requested': zoom,
-                'actual_zoom': actual_zoom,
-                'zoom_adjusted': zoom_adjusted,
-                'tiles_found': tiles_found,
-                'tiles_missing': tiles_missing,
-                'total_tiles': tiles_found + tiles_missing,
-                'availability_ratio': tiles_found / (tiles_found + tiles_missing) if (tiles_found + tiles_missing) > 0 else 0,
-                'center_lat': center_lat,
-                'center_lon': center_lon,
-                'image_width': width,
-                'image_height': height
-            }
+            metadata = self._composite_metadata(zoom, actual_zoom, tiles_found, tiles_missing,
+                                                center_lat, center_lon, width, height)
             
             return image_data, metadata
             
@@ -259,118 +633,378 @@ class MBTilesReader:
             logger.error(f"Error generating composite image: {e}")
             # Return error image
             error_image = Image.new('RGB', (width, height), (200, 200, 200))
-            output = BytesIO()
-            error_image.save(output, format='PNG')
-            return output.getvalue(), {'error': str(e)}
+            if not output_format:
+                return error_image, {'error': str(e)}
+            return self._encode_image(error_image, output_format), {'error': str(e)}
     
-    def _draw_placeholder_tile(self, image, x, y, size):
-        """Draw a placeholder tile on the composite image"""
-        from PIL import ImageDraw
-        
-        # Create a light gray tile with border
-        draw = ImageDraw.Draw(image)
-        
-        # Fill with light gray
-        draw.rectangle([x, y, x + size - 1, y + size - 1], fill=(220, 220, 220))
-        
-        # Draw border
-        draw.rectangle([x, y, x + size - 1, y + size - 1], outline=(180, 180, 180), width=1)
+    def _stored_format(self, tile_data, tile_size):
+        """Get the format of tile data that is exactly tile_size pixels, else None
         
-        # Draw diagonal lines
-        draw.line([x, y, x + size - 1, y + size - 1], fill=(180, 180, 180), width=1)
-        draw.line([x + size - 1, y, x, y + size - 1], fill=(180, 180, 180), width=1)
+        Only the header is read; nothing is decoded.
+        """
+        if not tile_data:
+            return None
+        if tile_data.startswith(PNG_SIGNATURE):
+            # IHDR width and height follow the signature and chunk header
+            if len(tile_data) >= 24 and struct.unpack('>II', tile_data[16:24]) == (tile_size, tile_size):
+                return 'PNG'
+            return None
+        try:
+            with Image.open(BytesIO(tile_data)) as image:
+                if image.size == (tile_size, tile_size):
+                    return image.format
+        except Exception:
+            pass
+        return None
+    
+    def _composite_metadata(self, zoom, actual_zoom, tiles_found, tiles_missing,
+                            center_lat, center_lon, width, height):
+        """Build the metadata dict returned alongside a composite image"""
+        total_tiles = tiles_found + tiles_missing
+        return {
+            'zoom_requested': zoom,
+            'actual_zoom': actual_zoom,
+            'zoom_adjusted': actual_zoom != zoom,
+            'tiles_found': tiles_found,
+            'tiles_missing': tiles_missing,
+            'total_tiles': total_tiles,
+            'availability_ratio': tiles_found / total_tiles if total_tiles > 0 else 0,
+            'center_lat': center_lat,
+            'center_lon': center_lon,
+            'image_width': width,
+            'image_height': height
+        }
+    
+    def _draw_placeholder_tile(self, canvas, x, y, size):
+        """Draw a placeholder tile on the composite pixel array"""
+        self._blit(canvas, _placeholder_tile(size), x, y)
+    
+    def _blit(self, canvas, pixels, x, y):
+        """Copy tile pixels onto the canvas at (x, y), clipped to the canvas edges"""
+        canvas_height, canvas_width = canvas.shape[:2]
+        tile_height, tile_width = pixels.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + tile_width, canvas_width), min(y + tile_height, canvas_height)
+        if x0 < x1 and y0 < y1:
+            canvas[y0:y1, x0:x1] = pixels[y0 - y:y1 - y, x0 - x:x1 - x]
     
     def close(self):
-        """Close database connection"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        """Close database connections"""
+        if self._prefetch_future is not None:
+            self._prefetch_future.cancel()
+        self._prefetch_executor.shutdown(wait=True)
+        self._decode_pool.shutdown(wait=True)
+        self._tile_cache.drop(self.filepath)
+        self._blob_cache.drop(self.filepath)
+        self._canvas_pool.clear()
+        self._output_pool.clear()
+        if self._pool:
+            while True:
+                try:
+                    self._pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._pool = None
 
 class MBTilesManager:
     """Enhanced manager for multiple MBTiles files with smart selection"""
     
-    def __init__(self, assets_folder):
+    def __init__(self, assets_folder, max_open_files=3):
         self.assets_folder = Path(assets_folder)
-        self.readers = {}
+        # Summary (bounds, zooms, center) of every file found; readers are opened on demand
+        self.available_files = {}
+        # Open readers, least recently used first, capped at max_open_files
+        self.max_open_files = max(1, max_open_files)
+        self.readers = OrderedDict()
         self.current_reader = None
         self.file_list = []
         self.current_file_index = 0
+        # Close whatever is still open if cleanup is never reached (GC or interpreter exit)
+        self._finalizer = weakref.finalize(self, self._close_readers, self.readers)
+        
+        # Sidecar cache of file summaries keyed by filename, valid while size and mtime match
+        self._meta_cache_path = self.assets_folder / ".mbtiles_meta.json"
+        
+        # Grid cells mapped to the bounds and names of files touching them, in load
+        # order, and centers as lat/lon rows in file order
+        # Rebuilt as one (names, grid, centers, misses) tuple by the startup scan,
+        # _drop_file and cleanup, so a lookup unpacks a consistent snapshot even if
+        # cleanup runs on another thread; misses maps uncovered cells to their
+        # closest file and resets with it
+        self._bounds_index = ((), {}, np.empty((2, 0)), OrderedDict())
+        # Guards the open readers against concurrent opens and cleanup
+        self._readers_lock = threading.Lock()
         
         # Ensure assets folder exists
         self.assets_folder.mkdir(parents=True, exist_ok=True)
         
-        # Load all MBTiles files
-        self._load_mbtiles_files()
+        # Find all MBTiles files
+        self._scan_assets_folder()
         
-        logger.info(f"MBTilesManager initialized with {len(self.readers)} files")
+        logger.info(f"MBTilesManager initialized with {len(self.available_files)} files")
     
-    def _load_mbtiles_files(self):
-        """Load all MBTiles files from assets folder"""
-        mbtiles_files = list(self.assets_folder.glob("*.mbtiles"))
+    def _scan_assets_folder(self):
+        """Find MBTiles files in the assets folder and collect their summaries
+        
+        Summaries come from the sidecar cache when the file is unchanged, so
+        startup only opens new or modified files.
+        """
+        # One directory read and one stat per file
+        with os.scandir(self.assets_folder) as entries:
+            mbtiles_files = [(Path(entry.path), entry.stat()) for entry in entries
+                             if entry.name.endswith('.mbtiles') and entry.is_file()]
         
         if not mbtiles_files:
             logger.warning(f"No MBTiles files found in {self.assets_folder}")
             return
         
-        for filepath in mbtiles_files:
+        cached = self._read_meta_cache()
+        available_files = {}
+        
+        stale = [(filepath, stat) for filepath, stat in mbtiles_files
+                 if (filepath.name not in cached or
+                     cached[filepath.name].get('size') != stat.st_size or
+                     cached[filepath.name].get('mtime') != stat.st_mtime)]
+        changed = bool(stale)
+        
+        # Opening files is mostly SQLite I/O with the GIL released, so new or
+        # modified files are summarized concurrently
+        loading = {}
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(4, len(stale))) as executor:
+                loading = {filepath.name: executor.submit(self._load_file_metadata, filepath, stat)
+                           for filepath, stat in stale}
+        
+        for filepath, stat in mbtiles_files:
             try:
-                reader = MBTilesReader(str(filepath))
-                self.readers[filepath.name] = reader
-                self.file_list.append(filepath.name)
-                logger.info(f"Loaded MBTiles file: {filepath.name} ({reader.name})")
+                if filepath.name in loading:
+                    summary = loading[filepath.name].result()
+                else:
+                    summary = cached[filepath.name]
+                summary['path'] = str(filepath)
+                available_files[filepath.name] = summary
+                logger.info(f"Found MBTiles file: {filepath.name} ({summary['name']})")
                 
             except Exception as e:
                 logger.error(f"Failed to load MBTiles file {filepath}: {e}")
         
-        # Set first file as current if available
-        if self.file_list:
-            self.current_reader = self.readers[self.file_list[0]]
+        if changed or len(cached) != len(available_files):
+            self._write_meta_cache(available_files)
+        
+        # Swap in the new state whole rather than filling the live containers
+        self.available_files = available_files
+        self.file_list = list(available_files)
+        self._build_bounds_index()
+        
+        # Set the first readable file as current; unreadable ones drop out of file_list
+        while self.file_list and self.current_reader is None:
+            self.current_reader = self._get_or_open_file(self.file_list[0])
+        if self.current_reader:
             logger.info(f"Set current MBTiles file: {self.file_list[0]}")
     
+    def _load_file_metadata(self, filepath, stat):
+        """Open an MBTiles file once to summarize its metadata"""
+        # Metadata needs a single connection, not the rendering pool
+        reader = MBTilesReader(str(filepath), pool_size=1)
+        try:
+            return {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'name': reader.name,
+                'bounds': reader.bounds,
+                'min_zoom': reader.min_zoom,
+                'max_zoom': reader.max_zoom,
+                'center_lat': reader.center_lat,
+                'center_lon': reader.center_lon
+            }
+        finally:
+            reader.close()
+    
+    def _read_meta_cache(self):
+        """Read the sidecar summary cache, or {} if missing, unreadable or outdated"""
+        try:
+            with open(self._meta_cache_path, 'r') as f:
+                cached = json.load(f)
+            if not isinstance(cached, dict) or cached.get('version') != META_CACHE_VERSION:
+                return {}
+            return cached.get('files', {})
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring MBTiles metadata cache {self._meta_cache_path}: {e}")
+            return {}
+    
+    def _write_meta_cache(self, available_files):
+        """Write the sidecar summary cache atomically"""
+        try:
+            entries = {filename: {key: value for key, value in summary.items() if key != 'path'}
+                       for filename, summary in available_files.items()}
+            tmp_path = self._meta_cache_path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': META_CACHE_VERSION, 'files': entries}, f)
+            os.replace(tmp_path, self._meta_cache_path)
+        except Exception as e:
+            logger.warning(f"Could not write MBTiles metadata cache: {e}")
+    
+    def _get_or_open_file(self, filename):
+        """Get the reader for a file, opening it on first use
+        
+        Opening a file beyond max_open_files closes the least recently used
+        ones, so at most max_open_files readers stay open.
+        """
+        with self._readers_lock:
+            reader = self.readers.get(filename)
+            if reader is not None:
+                self.readers.move_to_end(filename)
+                return reader
+            
+            summary = self.available_files.get(filename)
+            if summary is None:
+                return None
+            
+            try:
+                reader = MBTilesReader(summary['path'])
+            except (sqlite3.Error, OSError) as e:
+                # Files open lazily, so a corrupt or unreadable one only shows up here
+                logger.error(f"Skipping unreadable MBTiles file {filename}: {e}")
+                self._drop_file(filename)
+                return None
+            self.readers[filename] = reader
+            logger.info(f"Opened MBTiles file: {filename}")
+            
+            # The new reader is the most recent entry, so eviction never reaches it
+            while len(self.readers) > self.max_open_files:
+                self._close_oldest_file()
+            
+            # Let kernel readahead pull in the leading pages (header and B-tree
+            # roots) while the first tiles render; bounded for large archives
+            if hasattr(os, 'posix_fadvise'):
+                try:
+                    fd = os.open(summary['path'], os.O_RDONLY)
+                    try:
+                        os.posix_fadvise(fd, 0, min(summary['size'], 16 << 20), os.POSIX_FADV_WILLNEED)
+                    finally:
+                        os.close(fd)
+                except OSError as e:
+                    logger.debug(f"Could not prefetch {filename}: {e}")
+            
+            return reader
+    
+    def _drop_file(self, filename):
+        """Remove a file from the available files and the bounds index"""
+        available_files = {name: summary for name, summary in self.available_files.items()
+                           if name != filename}
+        self.available_files = available_files
+        self.file_list = list(available_files)
+        self._build_bounds_index()
+        
+        # Keep current_file_index pointing at the current reader
+        current = self.current_reader.filename if self.current_reader else None
+        self.current_file_index = self.file_list.index(current) if current in available_files else 0
+    
+    def _close_oldest_file(self):
+        """Close the least recently used reader
+        
+        This is the current reader only when max_open_files is 1; callers make
+        the reader just opened current, so it is cleared here until they do.
+        """
+        filename, reader = self.readers.popitem(last=False)
+        if reader is self.current_reader:
+            self.current_reader = None
+        reader.close()
+        logger.info(f"Closed MBTiles file: {filename}")
+    
+    @staticmethod
+    def _close_readers(readers):
+        """Close and remove every reader in readers"""
+        while readers:
+            filename, reader = readers.popitem()
+            try:
+                reader.close()
+            except Exception as e:
+                logger.error(f"Error closing MBTiles file {filename}: {e}")
+    
+    def _build_bounds_index(self):
+        """Bucket file bounds into grid cells and stack centers for nearest selection"""
+        available_files = self.available_files
+        names = tuple(available_files)
+        grid = {}
+        centers = []
+        for filename in names:
+            summary = available_files[filename]
+            centers.append((summary['center_lat'], summary['center_lon']))
+            
+            # Files without bounds only count for nearest
+            b = summary['bounds']
+            if not b:
+                continue
+            entry = (b['west'], b['south'], b['east'], b['north'], filename)
+            south = math.floor(max(b['south'], -90.0) / GRID_CELL_DEGREES)
+            north = math.floor(min(b['north'], 90.0) / GRID_CELL_DEGREES)
+            west = math.floor(max(b['west'], -180.0) / GRID_CELL_DEGREES)
+            east = math.floor(min(b['east'], 180.0) / GRID_CELL_DEGREES)
+            for cell_lat in range(south, north + 1):
+                for cell_lon in range(west, east + 1):
+                    grid.setdefault((cell_lat, cell_lon), []).append(entry)
+        centers = np.ascontiguousarray(np.array(centers, dtype=np.float64).reshape(-1, 2).T)
+        
+        self._bounds_index = (names, grid, centers, OrderedDict())
+    
     def get_reader_for_coordinates(self, lat, lon):
         """Get the best MBTiles reader for given coordinates"""
-        if not self.readers:
+        # Consecutive GPS fixes almost always fall in the region already selected
+        current_reader = self.current_reader
+        if current_reader and current_reader.contains_coordinates(lat, lon):
+            return current_reader
+        
+        names, grid, centers, misses = self._bounds_index
+        if not names:
             return None
         
-        # First, try to find a reader that contains the coordinates
-        containing_readers = []
-        for filename, reader in self.readers.items():
-            if reader.contains_coordinates(lat, lon):
-                containing_readers.append((filename, reader))
+        # First file in load order containing the coordinates, among those in its grid cell
+        selected_filename = None
+        closest_filename = None
+        cell = (math.floor(lat / GRID_CELL_DEGREES), math.floor(lon / GRID_CELL_DEGREES))
+        for west, south, east, north, filename in grid.get(cell, ()):
+            if west <= lon <= east and south <= lat <= north:
+                selected_filename = filename
+                break
+        else:
+            # Otherwise the file whose center is closest; outside coverage every fix
+            # would repeat this, so it is remembered per small cell
+            cell = (round(lat / MISS_CELL_DEGREES), round(lon / MISS_CELL_DEGREES))
+            closest_filename = misses.get(cell)
+            if closest_filename is not None:
+                misses.move_to_end(cell)
+            else:
+                cos_lat = math.cos(math.radians(lat))
+                dlat = centers[0] - lat
+                dlon = (centers[1] - lon) * cos_lat
+                closest_filename = names[int((dlat * dlat + dlon * dlon).argmin())]
+                misses[cell] = closest_filename
+                if len(misses) > MISS_CACHE_SIZE:
+                    misses.popitem(last=False)
         
-        if containing_readers:
-            # If multiple readers contain the coordinates, pick the first one
-            # In the future, we could add logic to pick the best one based on zoom levels, etc.
-            selected_filename, selected_reader = containing_readers[0]
-            
-            # Update current reader if it's different
+        if selected_filename:
+            selected_reader = self._get_or_open_file(selected_filename)
+            if selected_reader is None:
+                # The file was unreadable and has been dropped; pick again without it
+                return self.get_reader_for_coordinates(lat, lon)
             if self.current_reader != selected_reader:
                 self.current_reader = selected_reader
                 self.current_file_index = self.file_list.index(selected_filename)
                 logger.info(f"Auto-switched to MBTiles file: {selected_filename} for coordinates {lat:.4f}, {lon:.4f}")
-            
             return selected_reader
         
-        # If no reader contains the coordinates, find the closest one
-        closest_reader = None
-        min_distance = float('inf')
-        
-        for filename, reader in self.readers.items():
-            distance = reader.get_distance_to_center(lat, lon)
-            if distance < min_distance:
-                min_distance = distance
-                closest_reader = reader
-        
-        if closest_reader and self.current_reader != closest_reader:
-            # Find filename for the closest reader
-            for filename, reader in self.readers.items():
-                if reader == closest_reader:
-                    self.current_reader = closest_reader
-                    self.current_file_index = self.file_list.index(filename)
-                    logger.info(f"Auto-switched to closest MBTiles file: {filename} for coordinates {lat:.4f}, {lon:.4f}")
-                    break
+        closest_reader = self._get_or_open_file(closest_filename)
+        if closest_reader is None:
+            return self.get_reader_for_coordinates(lat, lon)
+        if self.current_reader != closest_reader:
+            self.current_reader = closest_reader
+            self.current_file_index = self.file_list.index(closest_filename)
+            logger.info(f"Auto-switched to closest MBTiles file: {closest_filename} for coordinates {lat:.4f}, {lon:.4f}")
         
-        return closest_reader or self.current_reader
+        return closest_reader
     
     def switch_to_next_file(self):
         """Switch to next MBTiles file"""
@@ -379,7 +1013,11 @@ class MBTilesManager:
         
         self.current_file_index = (self.current_file_index + 1) % len(self.file_list)
         filename = self.file_list[self.current_file_index]
-        self.current_reader = self.readers[filename]
+        reader = self._get_or_open_file(filename)
+        if reader is None:
+            # Unreadable file was dropped; step again from the current one
+            return self.switch_to_next_file()
+        self.current_reader = reader
         
         logger.info(f"Switched to MBTiles file: {filename}")
         return True
@@ -391,7 +1029,11 @@ class MBTilesManager:
         
         self.current_file_index = (self.current_file_index - 1) % len(self.file_list)
         filename = self.file_list[self.current_file_index]
-        self.current_reader = self.readers[filename]
+        reader = self._get_or_open_file(filename)
+        if reader is None:
+            # Unreadable file was dropped; step again from the current one
+            return self.switch_to_previous_file()
+        self.current_reader = reader
         
         logger.info(f"Switched to MBTiles file: {filename}")
         return True
@@ -417,23 +1059,24 @@ class MBTilesManager:
     def get_available_files(self):
         """Get list of available MBTiles files with their info"""
         files_info = {}
-        for filename, reader in self.readers.items():
+        for filename, summary in self.available_files.items():
             files_info[filename] = {
-                'name': reader.name,
-                'bounds': reader.bounds,
-                'min_zoom': reader.min_zoom,
-                'max_zoom': reader.max_zoom,
-                'center_lat': reader.center_lat,
-                'center_lon': reader.center_lon
+                'name': summary['name'],
+                'bounds': summary['bounds'],
+                'min_zoom': summary['min_zoom'],
+                'max_zoom': summary['max_zoom'],
+                'center_lat': summary['center_lat'],
+                'center_lon': summary['center_lon']
             }
         return files_info
     
     def cleanup(self):
         """Close all database connections"""
-        for reader in self.readers.values():
-            reader.close()
-        self.readers.clear()
-        self.file_list.clear()
+        with self._readers_lock:
+            self._close_readers(self.readers)
+        self.available_files = {}
+        self.file_list = []
+        self._build_bounds_index()
         self.current_reader = None
         logger.info("MBTilesManager cleanup completed")
 
@@ -454,7 +1097,7 @@ def main():
         # Create manager
         manager = MBTilesManager(assets_folder)
         
-        if not manager.readers:
+        if not manager.file_list:
             print("No MBTiles files found")
             return 1
         
@@ -27,6 +27,10 @@ class MBTiles:
         self._available_zooms = None
         self._tile_counts = {}
         
+        # Placeholder tiles are identical for every miss; render each size once
+        self._placeholder_tiles = {}
+        self._placeholder_images = {}
+        
         logger.info(f"Opened MBTiles database: {mbtiles_path}")
     
     def get_metadata(self):
@@ -138,14 +142,14 @@ class MBTiles:
     def deg2num(self, lat_deg, lon_deg, zoom):
         """Convert latitude/longitude to tile numbers"""
         lat_rad = math.radians(lat_deg)
-        n = 2.0 ** zoom
+        n = float(1 << zoom)
         x = (lon_deg + 180.0) / 360.0 * n
         y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
         return x, y
     
     def num2deg(self, x, y, zoom):
         """Convert tile numbers to latitude/longitude"""
-        n = 2.0 ** zoom
+        n = float(1 << zoom)
         lon_deg = x / n * 360.0 - 180.0
         lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * y / n)))
         lat_deg = math.degrees(lat_rad)
@@ -163,6 +167,9 @@ class MBTiles:
     
     def create_placeholder_tile(self, size=256):
         """Create a placeholder tile for missing tiles"""
+        if size in self._placeholder_tiles:
+            return self._placeholder_tiles[size]
+        
         image = Image.new('RGB', (size, size), color='white')
         draw = ImageDraw.Draw(image)
         
@@ -192,7 +199,17 @@ class MBTiles:
         # Convert to bytes
         buffer = io.BytesIO()
         image.save(buffer, format='PNG')
-        return buffer.getvalue()
+        self._placeholder_tiles[size] = buffer.getvalue()
+        return self._placeholder_tiles[size]
+    
+    def _placeholder_image(self, size=256):
+        """Get the decoded placeholder tile; paste() never modifies it"""
+        image = self._placeholder_images.get(size)
+        if image is None:
+            image = Image.open(io.BytesIO(self.create_placeholder_tile(size)))
+            image.load()
+            self._placeholder_images[size] = image
+        return image
     
     def generate_composite_image(self, lat, lon, zoom, width, height, use_fallback=True, crop_to_size=True):
         """
@@ -244,11 +261,11 @@ class MBTiles:
                             tiles_found += 1
                         except Exception as e:
                             logger.debug(f"Error loading tile {actual_zoom}/{tx}/{ty}: {e}")
-                            tile_image = Image.open(io.BytesIO(self.create_placeholder_tile()))
+                            tile_image = self._placeholder_image(tile_size)
                             tiles_missing += 1
                     else:
                         # Create placeholder for missing tile
-                        tile_image = Image.open(io.BytesIO(self.create_placeholder_tile()))
+                        tile_image = self._placeholder_image(tile_size)
                         tiles_missing += 1
                     
                     # Calculate position in composite
@@ -21,7 +21,7 @@ def test_gy511():
     # Initialize sensor
     gy511 = GY511()
     
-    if not gy511.initialize():
+    if not gy511.begin():
         print("❌ Failed to initialize GY-511 sensor")
         print("\nTroubleshooting:")
         print("1. Check I2C is enabled: sudo raspi-config")
@@ -43,15 +43,18 @@ def test_gy511():
         for i in range(20):  # 10 seconds at 0.5s intervals
             gy511.update_readings()
             
-            # Get all sensor data
-            accel_x, accel_y, accel_z = gy511.get_accelerometer_data()
-            mag_x, mag_y, mag_z = gy511.get_magnetometer_data()
+            # Get all sensor data (raw counts)
+            accel = gy511.get_accelerometer_data()
+            mag = gy511.get_magnetometer_data()
             heading = gy511.get_compass_heading()
             
             print(f"Reading {i+1:2d}/20:")
-            print(f"  Accelerometer: X={accel_x:6.3f}g, Y={accel_y:6.3f}g, Z={accel_z:6.3f}g")
-            print(f"  Magnetometer:  X={mag_x:6.3f}G, Y={mag_y:6.3f}G, Z={mag_z:6.3f}G")
-            print(f"  Compass:       {heading:6.1f}°")
+            print(f"  Accelerometer: X={accel['x']:6d}, Y={accel['y']:6d}, Z={accel['z']:6d}")
+            print(f"  Magnetometer:  X={mag['x']:6.1f}, Y={mag['y']:6.1f}, Z={mag['z']:6.1f}")
+            if heading is not None:
+                print(f"  Compass:       {heading:6.1f}°")
+            else:
+                print("  Compass:       no data")
             print()
             
             time.sleep(0.5)
@@ -59,6 +62,9 @@ def test_gy511():
     except KeyboardInterrupt:
         print("\nTest interrupted by user")
     
+    finally:
+        gy511.cleanup()
+    
     print("✅ GY-511 test completed successfully")
     return True
 